@@ -6,21 +6,23 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.models import (
     User, UserRole as ModelUserRole, PasswordResetToken,
     UserSession, UserLoginHistory, EmailVerificationToken
 )
 from app.schemas.schemas import UserCreate, UserResponse, Token
 from app.auth_logic import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
-    get_password_hash,
+    get_password_hash_async,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_user_by_email,
-    get_user_by_username
+    get_user_by_email_async,
+    get_user_by_username_async
 )
 
 router = APIRouter()
@@ -28,17 +30,17 @@ logger = logging.getLogger(__name__)
 
 # === ユーザー登録 ===
 @router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"[REGISTER] 登録リクエスト: username={user.username}, email={user.email}")
 
-    if get_user_by_email(db, email=user.email):
+    if await get_user_by_email_async(db, email=user.email):
         logger.warning(f"[REGISTER] 重複メール: {user.email}")
         raise HTTPException(status_code=400, detail="Email already registered")
-    if get_user_by_username(db, username=user.username):
+    if await get_user_by_username_async(db, username=user.username):
         logger.warning(f"[REGISTER] 重複ユーザー名: {user.username}")
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         email=user.email,
         username=user.username,
@@ -49,8 +51,8 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         is_email_verified=False
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     # メール確認トークン発行
     token = str(uuid.uuid4())
@@ -60,7 +62,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         expires_at=datetime.utcnow() + timedelta(days=1)
     )
     db.add(token_entry)
-    db.commit()
+    await db.commit()
 
     logger.info(f"[REGISTER] 登録成功: user_id={db_user.id}, email={db_user.email}")
     logger.info(f"[REGISTER] メール認証URL: http://localhost:3000/verify-email/{token}")
@@ -90,20 +92,21 @@ def verify_email(token: str, db: Session = Depends(get_db)):
 
 # === ログイン + セッション + 履歴 ===
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     request: Request = None
 ):
     logger.info(f"[LOGIN] ログイン試行: username={form_data.username}")
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
 
     if not user:
         logger.warning(f"[LOGIN] 認証失敗: username={form_data.username}")
         raise HTTPException(status_code=401, detail="Incorrect username or password")
 
     # 多重ログイン防止
-    deleted_count = db.query(UserSession).filter_by(user_id=user.id).delete()
+    result = await db.execute(delete(UserSession).filter_by(user_id=user.id))
+    deleted_count = result.rowcount
     logger.info(f"[LOGIN] 既存セッション削除: count={deleted_count}")
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -127,7 +130,7 @@ def login_for_access_token(
     )
     db.add(login_history)
 
-    db.commit()
+    await db.commit()
     logger.info(f"[LOGIN] ログイン成功: user_id={user.id}, token=発行済")
 
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
@@ -1,16 +1,17 @@
 from datetime import timedelta, datetime
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.models.models import User
 from app.database import get_db
+from app.principal_cache import Principal, principal_cache
+from app.password_hashing import password_hasher
+from typing import Optional
 import os
 
-# パスワードハッシュ
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # 環境変数 or デフォルト
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = "HS256"
@@ -18,15 +19,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")  # 実際のtokenエンドポイントに合わせて調整
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt はハッシュ専用プロセスプールで実行し、イベントループもスレッドプールも塞がない
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username_async(db, username)
+    if not user or not await password_hasher.verify(password, user.hashed_password):
         return None
     return user
 
@@ -36,13 +35,18 @@ def create_access_token(data: dict, expires_delta: timedelta):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    return await db.scalar(select(User).filter(User.email == email))
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    return await db.scalar(select(User).filter(User.username == username))
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    # キャッシュ済みならデコードも DB 検索も行わない
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -59,14 +63,34 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(User).filter(User.username == username).first()
     if user is None:
         raise credentials_exception
-    return user
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+    principal = Principal.from_user(user)
+    principal_cache.put(token, principal, token_expires_at=payload.get("exp"))
+    return principal
+
+def get_websocket_user(websocket: WebSocket, token: Optional[str] = None, db: Session = Depends(get_db)) -> Principal:
+    # OAuth2PasswordBearer は HTTP リクエスト専用のため、WebSocket では Authorization ヘッダー
+    # またはクエリ ?token=（ブラウザの WebSocket API はヘッダーを付けられない）から取り出す
+    if token is None:
+        scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = None
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    try:
+        principal = get_current_user(token, db)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    if not principal.is_active:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    return principal
+
+def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
+def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
\ No newline at end of file
@@ -0,0 +1,154 @@
+# app/bulk_notifications.py
+"""
+一斉通知（フェーズ変更のお知らせなど）
+
+宛先の抽出と通知行の作成は INSERT ... SELECT ... RETURNING user_id の 1 文で行い、数万人でも行ごとの往復をしない。
+宛先条件を評価するのはこの 1 回だけで、未読数カウンタの加算とリアルタイム配信には返ってきた
+ユーザー ID を使う（途中で投票やチーム・部署が変わっても、通知を受けた人とカウンタ・配信先がずれない）。
+カウンタは UPDATE ... WHERE id IN (...) RETURNING で加算と同時に新しい値を受け取り、
+ユーザー ID と未読数の組をバスに 1 回だけ流す。各ワーカーは自分が接続を持つユーザーにだけフレームを積む。
+一斉通知の行は作成時点で dispatched とし、アウトボックスのディスパッチャーには載せない。
+"""
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Boolean, Integer, String, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.models.models import Notification, TeamMember, User, Vote
+from app.schemas.schemas import BulkNotificationCreate, NotificationAudience
+from app.websocket_manager import ConnectionManager, manager
+
+# 未読数を加算する UPDATE 1 文あたりの宛先数（IN のバインド変数の上限を超えないため）
+UNREAD_UPDATE_CHUNK_SIZE = 5000
+
+
+def recipient_ids(audience: str, department: Optional[str] = None,
+                  business_plan_id: Optional[int] = None, poc_plan_id: Optional[int] = None):
+    """SELECT of the user ids in an audience (one column named user_id)"""
+    if audience == NotificationAudience.ALL:
+        return select(User.id.label("user_id")).where(User.is_active == True)
+    if audience == NotificationAudience.DEPARTMENT:
+        return select(User.id.label("user_id")).where(User.is_active == True, User.department == department)
+    if audience == NotificationAudience.PLAN_VOTERS:
+        # votes は (user_id, business_plan_id) が一意なので DISTINCT 不要
+        return select(Vote.user_id.label("user_id")).where(Vote.business_plan_id == business_plan_id)
+    if audience == NotificationAudience.POC_TEAM:
+        return select(TeamMember.user_id.label("user_id")).where(TeamMember.poc_plan_id == poc_plan_id).distinct()
+    raise ValueError(f"Unknown audience: {audience}")
+
+
+def audience_spec(request: BulkNotificationCreate) -> dict:
+    return {
+        "audience": request.audience.value,
+        "department": request.department,
+        "business_plan_id": request.business_plan_id,
+        "poc_plan_id": request.poc_plan_id,
+    }
+
+
+async def insert_bulk_notifications(db: AsyncSession, request: BulkNotificationCreate) -> Dict[int, int]:
+    """
+    Create one notification per recipient with a single INSERT ... SELECT and
+    bump their unread counters; returns {recipient user id: new unread count}
+    """
+    recipients = recipient_ids(**audience_spec(request)).subquery()
+    rows = select(
+        recipients.c.user_id,
+        literal(request.title, String),
+        literal(request.message, String),
+        literal(request.notification_type, String),
+        literal(request.related_id, Integer),
+        literal(False, Boolean),
+        literal("dispatched", String),
+        func.now(),
+    )
+    user_ids = (await db.execute(
+        insert(Notification).from_select(
+            ["user_id", "title", "message", "notification_type", "related_id",
+             "is_read", "delivery_status", "dispatched_at"],
+            rows,
+        ).returning(Notification.user_id)
+    )).scalars().all()
+    unread_counts = {}
+    for start in range(0, len(user_ids), UNREAD_UPDATE_CHUNK_SIZE):
+        result = await db.execute(
+            update(User)
+            .where(User.id.in_(user_ids[start:start + UNREAD_UPDATE_CHUNK_SIZE]))
+            .values(unread_notification_count=User.unread_notification_count + 1,
+                    notifications_version=User.notifications_version + 1,
+                    updated_at=User.updated_at)
+            .returning(User.id, User.unread_notification_count)
+            .execution_options(synchronize_session=False)
+        )
+        unread_counts.update(result.tuples().all())
+    return unread_counts
+
+
+def announcement_payload(request: BulkNotificationCreate) -> dict:
+    # 宛先ごとの通知 ID は含めない（必要ならクライアントが一覧を取り直す）
+    return {
+        "type": "new_notification",
+        "notification_data": {
+            "id": None,
+            "title": request.title,
+            "message": request.message,
+            "is_read": False,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "notification_type": request.notification_type,
+            "related_id": request.related_id,
+        },
+    }
+
+
+class AudienceDelivery:
+    """
+    Pushes one announcement frame to the locally connected recipients of a bulk notification
+    """
+
+    def __init__(self, connections: ConnectionManager):
+        self.connections = connections
+        self.announcements = 0
+        self.recipients = 0
+        self.frames_sent = 0
+        self.connections.bus.subscribe("audience", self._on_audience_message)
+
+    def publish(self, request: BulkNotificationCreate, unread_counts: Dict[int, int]):
+        """Send the announcement with the recipients returned by insert_bulk_notifications()"""
+        self.announcements += 1
+        self.recipients += len(unread_counts)
+        self.connections.bus.publish({
+            "kind": "audience",
+            # JSON のキーは文字列になるので [user_id, count] の組で送る
+            "unread_counts": list(unread_counts.items()),
+            "message": json.dumps(announcement_payload(request)),
+        })
+
+    def _on_audience_message(self, event: dict):
+        # 宛先は送信側で確定済み。宛先条件を評価し直さず、このワーカーの接続ユーザーにだけ積む
+        active = self.connections.active_connections
+        self._deliver(
+            ((user_id, count) for user_id, count in event["unread_counts"] if user_id in active),
+            event["message"],
+        )
+
+    def _deliver(self, rows: Iterable, message: str):
+        for user_id, unread_count in rows:
+            unread = '{"type": "unread_count", "count": %d}' % unread_count
+            for connection in list(self.connections.active_connections.get(user_id, ())):
+                connection.enqueue(message)
+                connection.enqueue(unread)
+                self.frames_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "announcements": self.announcements,
+            "recipients": self.recipients,
+            "frames_sent": self.frames_sent,
+        }
+
+
+audience_delivery = AudienceDelivery(manager)
+metrics.register("bulk_notifications", audience_delivery.stats)
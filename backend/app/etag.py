@@ -0,0 +1,84 @@
+# app/etag.py
+"""
+ETag と条件付き GET（If-None-Match）
+
+詳細・一覧レスポンスのバージョンを、本体を読み込まずに 1 回の軽い SELECT
+（更新日時、投票数カウンタ、関連行の件数・最大 ID などのスカラーサブクエリ、
+通知一覧はユーザーごとの版カウンタ）で求め、
+そのハッシュを強い ETag として返す。If-None-Match が一致すれば ORM の読み込みも
+シリアライズもせずに 304 を返す。
+
+バージョンは本体より先に読む。間に書き込みがあっても、新しい本体に古い ETag が付くだけなので
+次回は一致せず 200 になる（古い内容に 304 を返すことはない）。
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+
+from app.models.models import BusinessPlan, PoCPlan, TeamMember, User
+
+# レスポンスの形式を変えたら上げる（古い ETag を一斉に無効にする）
+ETAG_SCHEMA_VERSION = 3
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(repr((ETAG_SCHEMA_VERSION,) + parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def business_plan_version(business_plan_id: int):
+    """Version of BusinessPlanDetailResponse: the plan, its vote count, creator and PoC plans"""
+    return select(
+        BusinessPlan.updated_at,
+        BusinessPlan.vote_count,
+        select(User.updated_at).where(User.id == BusinessPlan.creator_id).scalar_subquery(),
+        select(func.count(PoCPlan.id)).where(PoCPlan.business_plan_id == BusinessPlan.id).scalar_subquery(),
+        select(func.max(PoCPlan.id)).where(PoCPlan.business_plan_id == BusinessPlan.id).scalar_subquery(),
+        select(func.max(func.coalesce(PoCPlan.updated_at, PoCPlan.created_at)))
+        .where(PoCPlan.business_plan_id == BusinessPlan.id).scalar_subquery(),
+    ).where(BusinessPlan.id == business_plan_id)
+
+
+def poc_plan_version(poc_plan_id: int):
+    """Version of PoCPlanDetailResponse: the PoC plan, its creator, business plan and team"""
+    return select(
+        PoCPlan.updated_at,
+        select(User.updated_at).where(User.id == PoCPlan.creator_id).scalar_subquery(),
+        select(BusinessPlan.updated_at).where(BusinessPlan.id == PoCPlan.business_plan_id).scalar_subquery(),
+        select(BusinessPlan.vote_count).where(BusinessPlan.id == PoCPlan.business_plan_id).scalar_subquery(),
+        select(func.count(TeamMember.id)).where(TeamMember.poc_plan_id == PoCPlan.id).scalar_subquery(),
+        select(func.max(TeamMember.id)).where(TeamMember.poc_plan_id == PoCPlan.id).scalar_subquery(),
+        select(func.max(User.updated_at))
+        .join(TeamMember, TeamMember.user_id == User.id)
+        .where(TeamMember.poc_plan_id == PoCPlan.id).scalar_subquery(),
+    ).where(PoCPlan.id == poc_plan_id)
+
+
+def notifications_version(user_id: int):
+    """
+    Version of a user's notifications: User.notifications_version, bumped by
+    every write to the user's notifications (see app/unread_counter.py)
+    """
+    return select(User.notifications_version).where(User.id == user_id)
@@ -1,9 +1,16 @@
 from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect, Request
 from .routers import business_plans, notifications, poc_plans, users
 from app.websocket_manager import manager
+from app import metrics
 from app.auth import router as auth_router
-from app.auth_logic import get_current_active_user, get_current_admin_user
+from app.auth_logic import get_current_admin_user, get_websocket_user
+from app.principal_cache import Principal
 from app.models.models import User
+from app.vote_ingest import vote_ingestor
+from app.password_hashing import password_hasher
+from app.pubsub import bus
+from app.notification_outbox import notification_dispatcher
+from app.notification_retention import notification_sweeper
 import logging
 
 # === ロギング設定 ===
@@ -27,6 +34,41 @@ def health_check():
     logger.debug("GET /health called")
     return {"status": "healthy"}
 
+@app.get("/metrics")
+def read_metrics(current_user: Principal = Depends(get_current_admin_user)):
+    """
+    Process-local runtime statistics (admin only)
+    """
+    return metrics.snapshot()
+
+# === ライフサイクル ===
+@app.on_event("shutdown")
+def shutdown_vote_ingestor():
+    # キューに残った投票を書き込んでから停止
+    vote_ingestor.stop()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("startup")
+async def start_notification_sweeper():
+    notification_sweeper.start()
+
+@app.on_event("shutdown")
+async def stop_notification_sweeper():
+    await notification_sweeper.stop()
+
+@app.on_event("startup")
+async def start_pubsub():
+    await bus.start()
+    notification_dispatcher.start()
+
+@app.on_event("shutdown")
+async def stop_pubsub():
+    await notification_dispatcher.stop()
+    await bus.stop()
+
 # === 各ルーターをインクルード ===
 logger.debug("Including routers")
 app.include_router(business_plans, prefix="/business_plans", tags=["Business Plan"])
@@ -37,17 +79,19 @@ app.include_router(users, prefix="/users", tags=["Users"])
 
 # === WebSocket エンドポイント ===
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, current_user: User = Depends(get_current_active_user)):
+async def websocket_endpoint(websocket: WebSocket, current_user: Principal = Depends(get_websocket_user)):
     user_id = current_user.id
     logger.debug(f"WebSocket connection start: user_id={user_id}")
-    await manager.connect(websocket, user_id)
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
             data = await websocket.receive_text()
             logger.debug(f"WebSocket message from user {user_id}: {data}")
+            # {"action": "subscribe" | "unsubscribe", "topics": ["plan:1", "plans:list"]}
+            await manager.handle_client_message(connection, data)
     except WebSocketDisconnect:
         logger.debug(f"WebSocket disconnected: user_id={user_id}")
-        manager.disconnect(websocket, user_id)
+        await manager.disconnect(websocket, user_id)
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
-        manager.disconnect(websocket, user_id)
+        await manager.disconnect(websocket, user_id)
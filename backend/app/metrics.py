@@ -0,0 +1,55 @@
+# app/metrics.py
+"""
+プロセス内メトリクス
+
+各コンポーネントが register() で統計関数を登録し、/metrics（管理者のみ）で
+まとめて返す。ワーカープロセスごとの値である点に注意。
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Sequence
+
+# 待ち時間など秒単位の値の既定バケット
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed upper bounds (Prometheus style)
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[f"le_{bound}"] = running
+        running += counts[-1]
+        cumulative["le_inf"] = running
+        return {"count": running, "sum": total, "buckets": cumulative}
+
+
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    """Register a callable returning the current statistics of a component"""
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, dict]:
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,183 @@
+# app/migrations/__init__.py
+"""
+バージョン管理されたスキーマ移行
+
+このパッケージの vNNNN_*.py が 1 つの移行で、DESCRIPTION と upgrade(ctx) を持つ。
+適用済みのバージョンは schema_migrations テーブルに記録し、未適用のものだけを番号順に流す。
+
+各ステップは自動コミットの接続で 1 文ずつ実行する（PostgreSQL の CREATE INDEX CONCURRENTLY は
+トランザクション内で実行できないため）。途中で失敗した移行は記録されないので、もう一度流すと
+最初からやり直す。そのため各ステップは IF NOT EXISTS などで冪等に書くこと。
+
+v0001 は移行導入前のスキーマを固定したもので、app.models からは作らない。
+モデルに列やインデックスを足したら、既存のデータベースにも届くよう必ず新しい移行を追加する。
+"""
+import importlib
+import logging
+import pkgutil
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(64) PRIMARY KEY,
+    description VARCHAR,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class MigrationContext:
+    """
+    Helpers for writing idempotent, lock-friendly migration steps
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+
+    @property
+    def is_postgresql(self) -> bool:
+        return self.dialect == "postgresql"
+
+    def _run(self, sql: str, params: Optional[dict], consume: Callable):
+        # 結果は接続をプールへ返す前に読み切る
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            return consume(conn.execute(text(sql), params or {}))
+
+    def execute(self, sql: str, params: Optional[dict] = None) -> int:
+        """Run one statement and return the number of affected rows"""
+        return self._run(sql, params, lambda result: result.rowcount)
+
+    def fetchall(self, sql: str, params: Optional[dict] = None) -> list:
+        return self._run(sql, params, lambda result: result.all())
+
+    def scalar(self, sql: str, params: Optional[dict] = None):
+        return self._run(sql, params, lambda result: result.scalar())
+
+    def has_column(self, table: str, column: str) -> bool:
+        return any(c["name"] == column for c in inspect(self.engine).get_columns(table))
+
+    def add_column(self, table: str, column: str, definition: str) -> bool:
+        """
+        ALTER TABLE ... ADD COLUMN unless the column already exists; returns True
+        when it was added so the caller can backfill existing rows
+        """
+        if self.has_column(table, column):
+            return False
+        if_not_exists = "IF NOT EXISTS " if self.is_postgresql else ""
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {definition}")
+        return True
+
+    def _has_index_on(self, table: str, columns: Sequence[str], unique: bool = False) -> bool:
+        inspector = inspect(self.engine)
+        candidates = [i for i in inspector.get_indexes(table) if i.get("unique") or not unique]
+        candidates += inspector.get_unique_constraints(table)
+        return any(list(c["column_names"]) == list(columns) for c in candidates)
+
+    def _drop_invalid_index(self, name: str):
+        # CONCURRENTLY での作成が失敗すると INVALID なインデックスが残り、IF NOT EXISTS で素通りしてしまう
+        valid = self.scalar(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name",
+            {"name": name},
+        )
+        if valid is False:
+            logger.warning(f"Dropping invalid index {name} left by an interrupted build")
+            self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    def _is_partitioned(self, table: str) -> bool:
+        return bool(self.scalar(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p"
+            " JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table)",
+            {"table": table},
+        ))
+
+    def create_index(self, name: str, table: str, columns: Sequence[str], unique: bool = False,
+                     where: Optional[str] = None):
+        """
+        CREATE INDEX without blocking writes (CONCURRENTLY on PostgreSQL); no-op if an
+        equivalent index exists. Partial indexes (``where``) are only matched by name.
+        """
+        if self.is_postgresql:
+            self._drop_invalid_index(name)
+        if where is None and self._has_index_on(table, columns, unique):
+            return
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        # パーティションテーブルの親には CONCURRENTLY で作れない（各パーティションへは自動で作られる）
+        concurrently = "CONCURRENTLY " if self.is_postgresql and not self._is_partitioned(table) else ""
+        predicate = f" WHERE {where}" if where else ""
+        self.execute(
+            f"CREATE {kind} {concurrently}IF NOT EXISTS {name} ON {table} ({', '.join(columns)}){predicate}"
+        )
+
+    def add_unique_constraint(self, name: str, table: str, columns: Sequence[str]):
+        """
+        Add a UNIQUE constraint; on PostgreSQL the index is built concurrently first
+        so the ALTER TABLE only holds its lock briefly
+        """
+        if self._has_index_on(table, columns, unique=True):
+            return
+        self.create_index(name, table, columns, unique=True)
+        if self.is_postgresql:
+            self.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
+
+    def delete_duplicates(self, table: str, columns: Sequence[str]) -> int:
+        """Keep the oldest row of each duplicate group so a unique constraint can be added"""
+        if self._has_index_on(table, columns, unique=True):
+            return 0
+        key = ", ".join(columns)
+        not_null = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+        removed = self.execute(
+            f"DELETE FROM {table} WHERE {not_null}"
+            f" AND id NOT IN (SELECT MIN(id) FROM {table} WHERE {not_null} GROUP BY {key})"
+        )
+        if removed:
+            logger.warning(f"Removed {removed} duplicate row(s) from {table} ({key})")
+        return removed
+
+
+def available_migrations() -> List:
+    modules = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith("v"):
+            modules.append(importlib.import_module(f"{__name__}.{info.name}"))
+    return sorted(modules, key=lambda m: m.__name__)
+
+
+def _version(module) -> str:
+    return module.__name__.rsplit(".", 1)[-1]
+
+
+def applied_versions(engine: Engine) -> List[str]:
+    ctx = MigrationContext(engine)
+    ctx.execute(_CREATE_TABLE)
+    return [row[0] for row in ctx.fetchall("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def migrate(engine: Engine) -> List[str]:
+    """Apply every pending migration in order; returns the versions applied"""
+    ctx = MigrationContext(engine)
+    done = set(applied_versions(engine))
+    applied = []
+    for module in available_migrations():
+        version = _version(module)
+        if version in done:
+            continue
+        logger.info(f"Applying migration {version}: {module.DESCRIPTION}")
+        module.upgrade(ctx)
+        ctx.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (:version, :description)",
+            {"version": version, "description": module.DESCRIPTION},
+        )
+        applied.append(version)
+    return applied
+
+
+def migration_status(engine: Engine) -> List[tuple]:
+    """(version, description, applied) for every known migration"""
+    done = set(applied_versions(engine))
+    return [(_version(m), m.DESCRIPTION, _version(m) in done) for m in available_migrations()]
@@ -0,0 +1,142 @@
+"""
+Baseline: the schema as it was before versioned migrations existed
+
+The tables are frozen here instead of being read from app.models, so that a
+database created from this baseline goes through exactly the same later
+migrations as one created before them. Never edit this file; add a new
+migration for every schema change.
+"""
+from sqlalchemy import (
+    Boolean, Column, DateTime, Enum, ForeignKey, Integer, MetaData, String, Table, Text, func,
+)
+
+DESCRIPTION = "baseline schema"
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("full_name", String),
+    Column("department", String),
+    Column("role", Enum("user", "admin", name="userrole"), nullable=False),
+    Column("is_active", Boolean, default=True),
+    Column("is_email_verified", Boolean, default=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+Table(
+    "business_plans", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, index=True),
+    Column("description", Text),
+    Column("problem_statement", Text),
+    Column("solution", Text),
+    Column("target_market", Text),
+    Column("business_model", Text),
+    Column("competition", Text),
+    Column("implementation_plan", Text),
+    Column("creator_name", Text),
+    Column("creator_id", Integer, ForeignKey("users.id")),
+    Column("is_selected", Boolean, default=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+Table(
+    "votes", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("business_plan_id", Integer, ForeignKey("business_plans.id")),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "poc_plans", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, index=True),
+    Column("description", Text),
+    Column("technical_requirements", Text),
+    Column("implementation_details", Text),
+    Column("timeline", Text),
+    Column("resources_needed", Text),
+    Column("expected_outcomes", Text),
+    Column("creator_name", Text),
+    Column("creator_id", Integer, ForeignKey("users.id")),
+    Column("business_plan_id", Integer, ForeignKey("business_plans.id"), nullable=True),
+    Column("is_technical_only", Boolean, default=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+Table(
+    "team_members", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("poc_plan_id", Integer, ForeignKey("poc_plans.id")),
+    Column("role", String),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "notifications", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("title", String),
+    Column("message", Text),
+    Column("is_read", Boolean, default=False),
+    Column("notification_type", String),
+    Column("related_id", Integer),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "password_reset_tokens", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("token", String, unique=True, index=True, nullable=False),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "user_sessions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("token", String, nullable=False, unique=True),
+    Column("device_info", String),
+    Column("ip_address", String),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+Table(
+    "user_login_history", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("ip_address", String),
+    Column("user_agent", String),
+    Column("login_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+Table(
+    "email_verification_tokens", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("token", String, nullable=False, unique=True),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+
+def upgrade(ctx):
+    # checkfirst: 既存のデータベースではテーブルをそのまま残す
+    metadata.create_all(bind=ctx.engine)
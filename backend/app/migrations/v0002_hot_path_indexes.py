@@ -0,0 +1,22 @@
+"""
+Indexes and unique constraints for the columns the routers filter on
+"""
+DESCRIPTION = "hot-path indexes and uniqueness constraints"
+
+
+def upgrade(ctx):
+    # 1 ユーザー 1 プラン 1 票（古いデータベースには制約がない場合がある）
+    # 重複を消した分の vote_count は v0004 で列を追加するときに再計算する
+    ctx.delete_duplicates("votes", ["user_id", "business_plan_id"])
+    ctx.add_unique_constraint("uq_votes_user_plan", "votes", ["user_id", "business_plan_id"])
+    ctx.create_index("ix_votes_business_plan_id", "votes", ["business_plan_id"])
+
+    # 先頭列が poc_plan_id なのでチームメンバー一覧の検索にも使える
+    ctx.delete_duplicates("team_members", ["poc_plan_id", "user_id"])
+    ctx.add_unique_constraint("uq_team_members_plan_user", "team_members", ["poc_plan_id", "user_id"])
+
+    ctx.create_index(
+        "ix_notifications_user_id_is_read_created_at", "notifications", ["user_id", "is_read", "created_at"]
+    )
+    ctx.create_index("ix_poc_plans_business_plan_id", "poc_plans", ["business_plan_id"])
+
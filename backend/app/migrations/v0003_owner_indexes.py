@@ -0,0 +1,10 @@
+"""
+Indexes for the per-user sub-resources and profile counts
+"""
+DESCRIPTION = "indexes on plan creators and team member users"
+
+
+def upgrade(ctx):
+    ctx.create_index("ix_business_plans_creator_id", "business_plans", ["creator_id"])
+    ctx.create_index("ix_poc_plans_creator_id", "poc_plans", ["creator_id"])
+    ctx.create_index("ix_team_members_user_id", "team_members", ["user_id"])
@@ -0,0 +1,60 @@
+"""
+Columns added after the baseline: denormalized counters, the notification
+outbox state, keyset pagination indexes and the notification archive table
+"""
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, func
+
+DESCRIPTION = "vote/unread counters, notification outbox columns, archive table"
+
+metadata = MetaData()
+
+# FK の参照先を解決するためだけの最小定義（作成はしない）
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+notifications_archive = Table(
+    "notifications_archive", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE")),
+    Column("title", String),
+    Column("message", Text),
+    Column("is_read", Boolean),
+    Column("notification_type", String),
+    Column("related_id", Integer),
+    Column("created_at", DateTime(timezone=True)),
+    Column("delivery_status", String(16)),
+    Column("dispatched_at", DateTime(timezone=True), nullable=True),
+    Column("archived_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Index("ix_notifications_archive_user_id_created_at", "user_id", "created_at"),
+)
+
+
+def upgrade(ctx):
+    ctx.add_column("business_plans", "vote_count", "INTEGER NOT NULL DEFAULT 0")
+    # 列が既にあっても v0002 で重複票を消した分がずれている可能性があるので毎回数え直す
+    ctx.execute(
+        "UPDATE business_plans SET vote_count ="
+        " (SELECT COUNT(*) FROM votes WHERE votes.business_plan_id = business_plans.id)"
+    )
+
+    ctx.add_column("users", "unread_notification_count", "INTEGER NOT NULL DEFAULT 0")
+    ctx.execute(
+        "UPDATE users SET unread_notification_count ="
+        " (SELECT COUNT(*) FROM notifications"
+        "  WHERE notifications.user_id = users.id AND NOT notifications.is_read)"
+    )
+
+    # 既存の通知はアウトボックス導入前に配信済みなので、pending のまま残すと再送されてしまう
+    ctx.add_column("notifications", "dispatched_at", "TIMESTAMP WITH TIME ZONE")
+    if ctx.add_column("notifications", "delivery_status", "VARCHAR(16) NOT NULL DEFAULT 'pending'"):
+        ctx.execute("UPDATE notifications SET delivery_status = 'dispatched', dispatched_at = created_at")
+
+    ctx.create_index("ix_users_created_at_id", "users", ["created_at", "id"])
+    ctx.create_index("ix_business_plans_created_at_id", "business_plans", ["created_at", "id"])
+    ctx.create_index("ix_business_plans_vote_count_id", "business_plans", ["vote_count", "id"])
+    ctx.create_index("ix_poc_plans_created_at_id", "poc_plans", ["created_at", "id"])
+    ctx.create_index(
+        "ix_notifications_user_id_created_at_id", "notifications", ["user_id", "created_at", "id"]
+    )
+    ctx.create_index("ix_notifications_pending", "notifications", ["id"], where="delivery_status = 'pending'")
+
+    metadata.create_all(bind=ctx.engine, tables=[notifications_archive])
@@ -0,0 +1,38 @@
+"""
+Full-text search columns and indexes (PostgreSQL only; other backends use the in-process index)
+
+The statements are frozen copies of PlanSearch.ddl() at the time of this
+migration; later changes to app.search need a new migration.
+"""
+DESCRIPTION = "full-text search vectors and trigram indexes"
+
+STATEMENTS = [
+    "ALTER TABLE business_plans ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce(problem_statement, '')), 'C')"
+    " || setweight(to_tsvector('simple', coalesce(solution, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_business_plans_search_vector ON business_plans USING GIN (search_vector)",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_business_plans_search_trgm ON business_plans USING GIN (("
+    "coalesce(business_plans.title, '') || ' ' || coalesce(business_plans.description, '')"
+    " || ' ' || coalesce(business_plans.problem_statement, '')"
+    " || ' ' || coalesce(business_plans.solution, '')) gin_trgm_ops)",
+    "ALTER TABLE poc_plans ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce(technical_requirements, '')), 'C')"
+    " || setweight(to_tsvector('simple', coalesce(implementation_details, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_poc_plans_search_vector ON poc_plans USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_poc_plans_search_trgm ON poc_plans USING GIN (("
+    "coalesce(poc_plans.title, '') || ' ' || coalesce(poc_plans.description, '')"
+    " || ' ' || coalesce(poc_plans.technical_requirements, '')"
+    " || ' ' || coalesce(poc_plans.implementation_details, '')) gin_trgm_ops)",
+]
+
+
+def upgrade(ctx):
+    if not ctx.is_postgresql:
+        return
+    for statement in STATEMENTS:
+        ctx.execute(statement)
@@ -0,0 +1,17 @@
+"""
+Side table for pub/sub messages over the PostgreSQL NOTIFY payload limit
+"""
+DESCRIPTION = "pub/sub payload table for oversized NOTIFY messages"
+
+
+def upgrade(ctx):
+    if not ctx.is_postgresql:
+        return
+    # 数分で消える中継用のデータなので WAL を書かない UNLOGGED にする
+    ctx.execute(
+        "CREATE UNLOGGED TABLE IF NOT EXISTS pubsub_payloads ("
+        " id BIGSERIAL PRIMARY KEY,"
+        " payload TEXT NOT NULL,"
+        " created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    )
+    ctx.create_index("ix_pubsub_payloads_created_at", "pubsub_payloads", ["created_at"])
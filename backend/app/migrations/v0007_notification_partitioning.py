@@ -0,0 +1,106 @@
+"""
+Opt-in: convert notifications to monthly range partitions on created_at
+
+Only runs when NOTIFICATION_PARTITIONING is enabled (PostgreSQL). The
+existing table is copied into a new partitioned parent inside one
+transaction, so writers wait on the table lock rather than seeing a
+half-converted table. Enabling the setting later and re-running
+migrate.py is not enough on its own because this version is already
+recorded; run ``python migrate.py --partition-notifications`` instead.
+
+The column list, indexes and partition DDL are frozen copies of the
+Notification model and app.notification_retention at the time of this
+migration.
+"""
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+DESCRIPTION = "monthly range partitioning of notifications (NOTIFICATION_PARTITIONING)"
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "id", "user_id", "title", "message", "is_read", "notification_type", "related_id",
+    "created_at", "delivery_status", "dispatched_at",
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_notifications_pending ON notifications (id) WHERE delivery_status = 'pending'",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_id ON notifications (id)",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_user_id_created_at_id ON notifications (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_user_id_is_read_created_at"
+    " ON notifications (user_id, is_read, created_at)",
+]
+
+# 変換時に当月から何か月先までのパーティションを作るか（以降はスイーパーが作る）
+MONTHS_AHEAD = 2
+
+
+def _month_start(year: int, month: int) -> datetime:
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _partition_ddl(month: datetime) -> str:
+    end = _month_start(month.year, month.month + 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS notifications_{month:%Y_%m} PARTITION OF notifications"
+        f" FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    )
+
+
+def upgrade(ctx):
+    from app.database import NOTIFICATION_PARTITIONING
+
+    if NOTIFICATION_PARTITIONING:
+        partition_notifications(ctx)
+
+
+def partition_notifications(ctx):
+    if not ctx.is_postgresql:
+        raise RuntimeError("notifications can only be partitioned on PostgreSQL")
+    if ctx._is_partitioned("notifications"):
+        return
+
+    with ctx.engine.begin() as conn:
+        conn.execute(text("LOCK TABLE notifications IN ACCESS EXCLUSIVE MODE"))
+        # パーティションキーに NULL は入れられない
+        conn.execute(text("UPDATE notifications SET created_at = now() WHERE created_at IS NULL"))
+        conn.execute(text("ALTER TABLE notifications RENAME TO notifications_unpartitioned"))
+        sequence = conn.execute(
+            text("SELECT pg_get_serial_sequence('notifications_unpartitioned', 'id')")
+        ).scalar()
+
+        conn.execute(text(
+            "CREATE TABLE notifications (LIKE notifications_unpartitioned INCLUDING DEFAULTS)"
+            " PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("ALTER TABLE notifications ALTER COLUMN created_at SET NOT NULL"))
+        conn.execute(text("ALTER TABLE notifications ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text("ALTER TABLE notifications ADD FOREIGN KEY (user_id) REFERENCES users (id)"))
+        if sequence:
+            # 旧テーブルを消すと所有しているシーケンスも消えるので、所有者を付け替える
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY notifications.id"))
+
+        first = conn.execute(text("SELECT min(created_at) FROM notifications_unpartitioned")).scalar()
+        now = datetime.now(timezone.utc)
+        month = _month_start(first.year, first.month) if first else _month_start(now.year, now.month)
+        months = []
+        while month <= _month_start(now.year, now.month + MONTHS_AHEAD):
+            months.append(month)
+            month = _month_start(month.year, month.month + 1)
+        for month in months:
+            conn.execute(text(_partition_ddl(month)))
+
+        columns = ", ".join(COLUMNS)
+        copied = conn.execute(text(
+            f"INSERT INTO notifications ({columns}) SELECT {columns} FROM notifications_unpartitioned"
+        )).rowcount
+        conn.execute(text("DROP TABLE notifications_unpartitioned"))
+        # 旧テーブルのインデックス名が空いたので、同じインデックスを親テーブルに作る
+        for statement in INDEXES:
+            conn.execute(text(statement))
+
+    logger.info(f"Partitioned notifications into {len(months)} monthly partition(s); copied {copied} row(s)")
@@ -0,0 +1,8 @@
+"""
+Per-user notifications version counter (notification list ETags)
+"""
+DESCRIPTION = "users.notifications_version"
+
+
+def upgrade(ctx):
+    ctx.add_column("users", "notifications_version", "INTEGER NOT NULL DEFAULT 0")
@@ -1,8 +1,8 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Table, Enum as PgEnum
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Text, DateTime, Table, UniqueConstraint, Enum as PgEnum, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
-from app.database import Base
+from app.database import Base, NOTIFICATION_PARTITIONING
 
 # User role enum
 class UserRole(enum.Enum):
@@ -12,6 +12,9 @@ class UserRole(enum.Enum):
 # User model
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),  # 一覧のキーセットページネーション
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -22,6 +25,10 @@ class User(Base):
     role = Column(PgEnum("user", "admin", name="userrole", create_type=False), nullable=False)
     is_active = Column(Boolean, default=True)
     is_email_verified = Column(Boolean, default=False)
+    # 未読通知数（非正規化カウンタ、app/unread_counter.py が維持する）
+    unread_notification_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # 通知一覧の版。通知の追加・既読/未読の切り替え・削除のたびに増やし、一覧の ETag に使う
+    notifications_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -38,6 +45,12 @@ class User(Base):
 # Business Plan model
 class BusinessPlan(Base):
     __tablename__ = "business_plans"
+    __table_args__ = (
+        # 一覧のキーセットページネーション（作成順 / 投票数順）
+        Index("ix_business_plans_created_at_id", "created_at", "id"),
+        Index("ix_business_plans_vote_count_id", "vote_count", "id"),
+        Index("ix_business_plans_creator_id", "creator_id"),  # ユーザー別の一覧・件数
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -51,6 +64,7 @@ class BusinessPlan(Base):
     creator_name = Column(Text)
     creator_id = Column(Integer, ForeignKey("users.id"))
     is_selected = Column(Boolean, default=False)
+    vote_count = Column(Integer, nullable=False, default=0, server_default="0")  # votes の件数（非正規化カウンタ）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -62,6 +76,11 @@ class BusinessPlan(Base):
 # Vote model
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # 1ユーザー1プラン1票（ON CONFLICT DO NOTHING の衝突対象）
+        UniqueConstraint("user_id", "business_plan_id", name="uq_votes_user_plan"),
+        Index("ix_votes_business_plan_id", "business_plan_id"),  # プラン別の投票者・件数
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -75,6 +94,11 @@ class Vote(Base):
 # PoC Plan model
 class PoCPlan(Base):
     __tablename__ = "poc_plans"
+    __table_args__ = (
+        Index("ix_poc_plans_created_at_id", "created_at", "id"),  # 一覧のキーセットページネーション
+        Index("ix_poc_plans_business_plan_id", "business_plan_id"),
+        Index("ix_poc_plans_creator_id", "creator_id"),  # ユーザー別の一覧・件数
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -99,6 +123,11 @@ class PoCPlan(Base):
 # Team Member model
 class TeamMember(Base):
     __tablename__ = "team_members"
+    __table_args__ = (
+        # 1 プランに同じユーザーは 1 回だけ。先頭列が poc_plan_id なのでメンバー一覧にも使う
+        UniqueConstraint("poc_plan_id", "user_id", name="uq_team_members_plan_user"),
+        Index("ix_team_members_user_id", "user_id"),  # ユーザー別の所属チーム
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -113,19 +142,56 @@ class TeamMember(Base):
 # Notification model
 class Notification(Base):
     __tablename__ = "notifications"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_notifications_user_id_created_at_id", "user_id", "created_at", "id"),  # ユーザー別の新着順一覧
+        Index("ix_notifications_user_id_is_read_created_at", "user_id", "is_read", "created_at"),  # 未読一覧・一括既読
+        # 未配信分だけの部分インデックス（アウトボックスの取り出し用）
+        Index(
+            "ix_notifications_pending", "id",
+            postgresql_where=text("delivery_status = 'pending'"),
+            sqlite_where=text("delivery_status = 'pending'"),
+        ),
+        # パーティションキーは主キーに含める必要があるので、有効時のテーブルの主キーは (id, created_at)
+        {"postgresql_partition_by": "RANGE (created_at)"} if NOTIFICATION_PARTITIONING else {},
+    )
+    # ORM の同一性は従来どおり id だけで判定する（db.get(Notification, id) などはそのまま使える）
+    __mapper_args__ = {"primary_key": ["id"]}
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String)
     message = Column(Text)
     is_read = Column(Boolean, default=False)
     notification_type = Column(String)  # e.g., "vote", "team_join", "selection"
     related_id = Column(Integer)  # ID of related entity (business plan, poc plan, etc.)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(),
+                        primary_key=NOTIFICATION_PARTITIONING, nullable=not NOTIFICATION_PARTITIONING)
+    # アウトボックス: "pending" で書き込み、ディスパッチャーが WebSocket へ流したら "dispatched"
+    delivery_status = Column(String(16), nullable=False, default="pending", server_default="pending")
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     user = relationship("User", back_populates="notifications")
 
+# 保持期間を過ぎた既読通知の退避先（app/notification_retention.py が移す）
+class NotificationArchive(Base):
+    __tablename__ = "notifications_archive"
+    __table_args__ = (
+        Index("ix_notifications_archive_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # notifications.id をそのまま使う
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    title = Column(String)
+    message = Column(Text)
+    is_read = Column(Boolean)
+    notification_type = Column(String)
+    related_id = Column(Integer)
+    created_at = Column(DateTime(timezone=True))
+    delivery_status = Column(String(16))
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
 # Password Reset Token model
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
@@ -0,0 +1,201 @@
+# app/notification_outbox.py
+"""
+通知のアウトボックス
+
+ルーターは業務データと同じトランザクションで Notification を delivery_status="pending" のまま
+書き込むだけにし、WebSocket へのリアルタイム配信はバックグラウンドのディスパッチャーが
+まとめて行う（リクエストのレイテンシーに配信時間を含めない）。
+
+コミット時に新しい通知があればセッションイベントでディスパッチャーを起こし、取りこぼしは
+NOTIFICATION_OUTBOX_POLL_SECONDS ごとのポーリングで拾う。
+PostgreSQL では FOR UPDATE SKIP LOCKED で複数ワーカーが同じ行を重複配信しないようにする。
+
+保証の範囲: "dispatched" は「pub/sub バスが受け取り、全ワーカーへ送り出した」ことを表す。
+バスが受け取らなかった行は pending のまま残り、次のポーリングで再送される（バスまでは at-least-once。
+コミット前に落ちると二重に送られることがある）。その先の WebSocket への送信はベストエフォートで、
+未接続のユーザーや送信キューが溢れた接続には届かない。クライアントは接続時に一覧 API で取り直す。
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.models.models import Notification
+from app.websocket_manager import ConnectionManager, manager
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", "200"))
+NOTIFICATION_OUTBOX_POLL_SECONDS = float(os.getenv("NOTIFICATION_OUTBOX_POLL_SECONDS", "1.0"))
+
+_PENDING_FLAG = "notification_outbox_pending"
+
+
+def notification_payload(notification: Notification) -> dict:
+    return {
+        "type": "new_notification",
+        "notification_data": {
+            "id": notification.id,
+            "title": notification.title,
+            "message": notification.message,
+            "is_read": notification.is_read,
+            "created_at": notification.created_at.isoformat() if notification.created_at else None,
+            "notification_type": notification.notification_type,
+            "related_id": notification.related_id,
+        },
+    }
+
+
+class NotificationDispatcher:
+    """
+    Background task that drains pending notifications in batches and pushes them to WebSocket clients
+    """
+
+    def __init__(self, connections: ConnectionManager, session_factory=AsyncSessionLocal,
+                 batch_size: int = NOTIFICATION_OUTBOX_BATCH_SIZE,
+                 poll_seconds: float = NOTIFICATION_OUTBOX_POLL_SECONDS):
+        self.connections = connections
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dispatched = 0
+        self.batches = 0
+        self.retried = 0
+        self.errors = 0
+        self.delivery_lag_seconds = metrics.Histogram()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    def poke(self):
+        """Wake the dispatcher; safe to call from request threads"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.dispatch_batch() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Notification outbox dispatch failed: {e}")
+
+    async def dispatch_batch(self) -> int:
+        """
+        Push one batch of pending notifications and mark the ones the bus accepted
+        as dispatched; returns how many were dispatched, or 0 when some have to be
+        retried (which ends the current drain until the next poll)
+        """
+        async with self.session_factory() as db:
+            query = (
+                select(Notification)
+                .where(Notification.delivery_status == "pending")
+                .order_by(Notification.id)
+                .limit(self.batch_size)
+            )
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            notifications = (await db.scalars(query)).all()
+            if not notifications:
+                return 0
+
+            # バスへは順に積まれ、送信結果だけをまとめて待つ
+            accepted = await asyncio.gather(*(
+                self.connections.send_notification_to_user(n.user_id, notification_payload(n))
+                for n in notifications
+            ))
+            now = datetime.now(timezone.utc)
+            sent = [n for n, ok in zip(notifications, accepted) if ok]
+            if len(sent) < len(notifications):
+                self.retried += len(notifications) - len(sent)
+                logger.warning(
+                    f"pub/sub did not accept {len(notifications) - len(sent)} notification(s); "
+                    "they stay pending and will be retried"
+                )
+            for notification in sent:
+                if notification.created_at is not None:
+                    created_at = notification.created_at
+                    if created_at.tzinfo is None:
+                        created_at = created_at.replace(tzinfo=timezone.utc)
+                    self.delivery_lag_seconds.observe(max((now - created_at).total_seconds(), 0.0))
+
+            await db.execute(
+                update(Notification)
+                .where(Notification.id.in_([n.id for n in sent]))
+                .values(delivery_status="dispatched", dispatched_at=func.now())
+            )
+            await db.commit()
+
+        self.batches += 1
+        self.dispatched += len(sent)
+        return len(sent) if len(sent) == len(notifications) else 0
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "batch_size": self.batch_size,
+            "dispatched": self.dispatched,
+            "batches": self.batches,
+            "retried": self.retried,
+            "errors": self.errors,
+            "delivery_lag_seconds": self.delivery_lag_seconds.snapshot(),
+        }
+
+
+notification_dispatcher = NotificationDispatcher(manager)
+metrics.register("notification_outbox", notification_dispatcher.stats)
+
+
+def mark_outbox_pending(session: Session):
+    """Wake the dispatcher after ``session`` commits (for notifications written with Core inserts)"""
+    session.info[_PENDING_FLAG] = True
+
+
+# ORM で Notification を追加したセッションはコミット時にディスパッチャーを起こす
+# （AsyncSession も内部の Session のイベントが発火する）
+@event.listens_for(Session, "after_flush")
+def _note_new_notifications(session, flush_context):
+    if any(isinstance(obj, Notification) for obj in session.new):
+        session.info[_PENDING_FLAG] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop(_PENDING_FLAG, False):
+        notification_dispatcher.poke()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session):
+    session.info.pop(_PENDING_FLAG, None)
@@ -0,0 +1,286 @@
+# app/notification_retention.py
+"""
+通知の保持期間と退避
+
+notifications は投票のたびに増え続けるため、NOTIFICATION_RETENTION_DAYS を過ぎた既読通知を
+バックグラウンドのスイーパーが小さなバッチ（NOTIFICATION_SWEEP_BATCH_SIZE 件）ずつ退避して
+ライブのテーブルを小さく保つ。退避先は NOTIFICATION_ARCHIVE_MODE で選ぶ:
+  table  notifications_archive テーブルへ INSERT ... SELECT（既定）
+  jsonl  NOTIFICATION_ARCHIVE_DIR に月別の gzip 圧縮 JSONL（notifications-YYYY-MM.jsonl.gz）で追記
+未読の通知は期間を過ぎても残す（未読数カウンタは変わらない）。
+
+NOTIFICATION_PARTITIONING=true で notifications を月単位のレンジパーティションにしている場合
+（migrate.py の v0007 が変換する）は、スイープのたびに当月から NOTIFICATION_PARTITION_MONTHS_AHEAD か月先までの
+パーティションを作成する。
+
+スイープはワーカーごとに起動するが、実際に流すのはロックを取れた 1 つだけ
+（PostgreSQL はアドバイザリロック、それ以外は NOTIFICATION_SWEEP_LOCK_PATH のファイルロック）。
+"""
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, text
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.models.models import Notification, NotificationArchive
+from app.unread_counter import notifications_version_bump
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))  # 0 で退避しない
+NOTIFICATION_ARCHIVE_MODE = os.getenv("NOTIFICATION_ARCHIVE_MODE", "table")
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", "notification_archive")
+NOTIFICATION_SWEEP_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_SWEEP_INTERVAL_SECONDS", "3600"))
+NOTIFICATION_SWEEP_BATCH_SIZE = int(os.getenv("NOTIFICATION_SWEEP_BATCH_SIZE", "500"))
+# バッチ間の休止（ライブのトラフィックにロックと I/O を譲る）
+NOTIFICATION_SWEEP_PAUSE_SECONDS = float(os.getenv("NOTIFICATION_SWEEP_PAUSE_SECONDS", "0.1"))
+NOTIFICATION_PARTITION_MONTHS_AHEAD = int(os.getenv("NOTIFICATION_PARTITION_MONTHS_AHEAD", "2"))
+NOTIFICATION_SWEEP_LOCK_PATH = os.getenv("NOTIFICATION_SWEEP_LOCK_PATH", "/tmp/creative-hack-notification-sweep.lock")
+# pg_try_advisory_lock のキー（任意の固定値）
+_SWEEP_ADVISORY_LOCK_KEY = 0x6E6F7466
+
+_COLUMNS = [c.name for c in Notification.__table__.columns]
+
+
+def _month_start(year: int, month: int) -> datetime:
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"notifications_{month:%Y_%m}"
+
+
+def partition_ddl(month: datetime) -> str:
+    """CREATE TABLE for the monthly partition of notifications starting at ``month``"""
+    end = _month_start(month.year, month.month + 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF notifications"
+        f" FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    )
+
+
+def upcoming_months(now: datetime, ahead: int = NOTIFICATION_PARTITION_MONTHS_AHEAD) -> List[datetime]:
+    return [_month_start(now.year, now.month + offset) for offset in range(ahead + 1)]
+
+
+class NotificationSweeper:
+    """
+    Background task that moves expired read notifications out of the live table in small batches
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal,
+                 retention_days: int = NOTIFICATION_RETENTION_DAYS,
+                 mode: str = NOTIFICATION_ARCHIVE_MODE,
+                 archive_dir: str = NOTIFICATION_ARCHIVE_DIR,
+                 batch_size: int = NOTIFICATION_SWEEP_BATCH_SIZE,
+                 interval_seconds: float = NOTIFICATION_SWEEP_INTERVAL_SECONDS,
+                 pause_seconds: float = NOTIFICATION_SWEEP_PAUSE_SECONDS):
+        if mode not in ("table", "jsonl"):
+            raise ValueError(f"Unknown NOTIFICATION_ARCHIVE_MODE: {mode}")
+        self.session_factory = session_factory
+        self.retention_days = retention_days
+        self.mode = mode
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.pause_seconds = pause_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.batches = 0
+        self.partitions_created = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_sweep_seconds: Optional[float] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Notification retention sweep failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> Optional[Tuple[int, int]]:
+        """
+        Create upcoming partitions and sweep, unless another worker or process is
+        already doing it; returns (partitions created, notifications archived) or None
+        """
+        async with self._exclusive() as acquired:
+            if not acquired:
+                self.skipped += 1
+                return None
+            created = await self.ensure_partitions()
+            archived = await self.sweep()
+        return created, archived
+
+    @contextlib.asynccontextmanager
+    async def _exclusive(self) -> AsyncIterator[bool]:
+        # SKIP LOCKED は PostgreSQL でしか効かず、jsonl モードでは同じ行が二重に書かれるため、
+        # 全体を 1 つのワーカーに絞る
+        async with self.session_factory() as db:
+            bind = db.bind
+        if bind.dialect.name == "postgresql":
+            # セッションロックは取得した接続に付く。セッションはコミットのたびに接続をプールへ返すため、
+            # 専用の接続を確保してスイープが終わるまで返さず、同じ接続で解放する
+            async with bind.connect() as conn:
+                acquired = await conn.scalar(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": _SWEEP_ADVISORY_LOCK_KEY}
+                )
+                await conn.commit()
+                try:
+                    yield bool(acquired)
+                finally:
+                    if acquired:
+                        await conn.scalar(
+                            text("SELECT pg_advisory_unlock(:key)"), {"key": _SWEEP_ADVISORY_LOCK_KEY}
+                        )
+                        await conn.commit()
+            return
+        with self._file_lock() as acquired:
+            yield acquired
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        import fcntl
+
+        with open(NOTIFICATION_SWEEP_LOCK_PATH, "a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def sweep(self) -> int:
+        """Archive every expired read notification, one batch per transaction; returns the total"""
+        if self.retention_days <= 0:
+            return 0
+        start = time.perf_counter()
+        total = 0
+        while True:
+            moved = await self.sweep_batch()
+            total += moved
+            if moved < self.batch_size:
+                break
+            await asyncio.sleep(self.pause_seconds)
+        self.last_sweep_seconds = time.perf_counter() - start
+        if total:
+            logger.info(f"Archived {total} notification(s) older than {self.retention_days} days")
+        return total
+
+    async def sweep_batch(self) -> int:
+        """Move one batch to the archive and delete it from notifications; returns the batch size"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        async with self.session_factory() as db:
+            query = (
+                select(Notification.__table__)
+                .where(Notification.is_read == True, Notification.created_at < cutoff)
+                .order_by(Notification.id)
+                .limit(self.batch_size)
+            )
+            if db.get_bind().dialect.name == "postgresql":
+                # 複数ワーカーのスイーパーが同じ行を取り合わない
+                query = query.with_for_update(skip_locked=True)
+            rows = (await db.execute(query)).mappings().all()
+            if not rows:
+                return 0
+
+            ids = [row["id"] for row in rows]
+            if self.mode == "jsonl":
+                # ファイルへの追記が先。削除に失敗した場合は次回同じ行が重複して書かれる（at-least-once）
+                await asyncio.to_thread(self._append_jsonl, [dict(row) for row in rows])
+            else:
+                await db.execute(
+                    insert(NotificationArchive).from_select(
+                        _COLUMNS, select(Notification.__table__).where(Notification.id.in_(ids))
+                    )
+                )
+            await db.execute(delete(Notification).where(Notification.id.in_(ids)))
+            # 既読のみなので未読数は変わらないが、一覧からは消えるので ETag を無効にする
+            await db.execute(notifications_version_bump(row["user_id"] for row in rows if row["user_id"] is not None))
+            await db.commit()
+
+        self.batches += 1
+        self.archived += len(ids)
+        return len(ids)
+
+    def _append_jsonl(self, rows: List[dict]):
+        by_month = defaultdict(list)
+        for row in rows:
+            month = row["created_at"].strftime("%Y-%m") if row["created_at"] else "unknown"
+            by_month[month].append(json.dumps(row, default=str, ensure_ascii=False))
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for month, lines in by_month.items():
+            # gzip のメンバーを連結したファイルはそのまま gzip.open / zcat で読める
+            data = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+            with open(os.path.join(self.archive_dir, f"notifications-{month}.jsonl.gz"), "ab") as f:
+                f.write(data)
+
+    async def ensure_partitions(self) -> int:
+        """Create upcoming monthly partitions when notifications is range-partitioned (PostgreSQL only)"""
+        async with self.session_factory() as db:
+            if db.get_bind().dialect.name != "postgresql":
+                return 0
+            partitioned = await db.scalar(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p"
+                " JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'notifications')"
+            ))
+            if not partitioned:
+                return 0
+            created = 0
+            for month in upcoming_months(datetime.now(timezone.utc)):
+                exists = await db.scalar(
+                    text("SELECT to_regclass(:name) IS NOT NULL"), {"name": partition_name(month)}
+                )
+                if exists:
+                    continue
+                await db.execute(text(partition_ddl(month)))
+                created += 1
+            await db.commit()
+        self.partitions_created += created
+        return created
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "retention_days": self.retention_days,
+            "mode": self.mode,
+            "archived": self.archived,
+            "batches": self.batches,
+            "partitions_created": self.partitions_created,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_sweep_seconds": self.last_sweep_seconds,
+        }
+
+
+notification_sweeper = NotificationSweeper()
+metrics.register("notification_retention", notification_sweeper.stats)
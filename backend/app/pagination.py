@@ -0,0 +1,78 @@
+# app/pagination.py
+"""
+キーセット（カーソル）ページネーション
+
+一覧エンドポイントは従来の skip/limit に加えて cursor を受け付ける。
+次ページのカーソルはレスポンスヘッダー X-Next-Cursor で返す（本文の形式は変えない）。
+カーソルは並び順のキー値（例: (created_at, id)）を JSON 化して base64 でくるんだ不透明な文字列。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import String, literal, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> list:
+    """Decode a cursor into values typed after ``keys``; raises 400 on bad input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("cursor arity mismatch")
+        return [
+            datetime.fromisoformat(v) if key.type.python_type is datetime else key.type.python_type(v)
+            for key, v in zip(keys, values)
+        ]
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _boundary_value(key, value, dialect_name: Optional[str]):
+    # SQLite の server_default (CURRENT_TIMESTAMP) はマイクロ秒なしの文字列で保存されるため、
+    # 同じ書式の文字列で比較しないと同一秒内の行が境界から漏れる
+    if dialect_name == "sqlite" and isinstance(value, datetime):
+        return literal(str(value.replace(tzinfo=None)), String)
+    return literal(value, key.type)
+
+
+def paginate(query, keys: Sequence, *, cursor: Optional[str] = None, skip: int = 0,
+             limit: int = 100, descending: bool = False, dialect_name: Optional[str] = None):
+    """
+    Order ``query`` by ``keys`` and apply either the keyset condition for
+    ``cursor`` or the legacy OFFSET ``skip``
+    """
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    if cursor:
+        if dialect_name is None and getattr(query, "session", None) is not None:
+            dialect_name = query.session.get_bind().dialect.name
+        boundary = tuple_(*[
+            _boundary_value(key, value, dialect_name)
+            for key, value in zip(keys, decode_cursor(cursor, keys))
+        ])
+        query = query.filter(tuple_(*keys) < boundary if descending else tuple_(*keys) > boundary)
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, items: Sequence, keys: Sequence, limit: int):
+    """Expose the cursor of the page after ``items`` when the page is full"""
+    if items and len(items) >= limit:
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, key.key) for key in keys])
+
+
+def cursor_headers(response: Response) -> dict:
+    """The X-Next-Cursor header set by set_next_cursor(), for responses built by hand"""
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    return {NEXT_CURSOR_HEADER: cursor} if cursor is not None else {}
@@ -0,0 +1,120 @@
+# app/password_hashing.py
+"""
+パスワードハッシュ専用のプロセスプール
+
+bcrypt は 1 回あたり数百ミリ秒 CPU を占有するため、ログイン集中時に
+リクエスト処理のスレッドプールを使い切らないよう専用プロセスで実行する。
+同時に受け付ける件数は PASSWORD_HASH_MAX_PENDING で制限し、超えた分は
+イベントループ上で待機させる。
+ワーカーは spawn で起動するため、スクリプトから使う場合は
+if __name__ == "__main__": ガードの内側で実行すること。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from app import metrics
+
+# パスワードハッシュ
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# プールはワーカープロセスごとに作られるので、既定では CPU 数を WEB_CONCURRENCY（uvicorn / gunicorn の
+# ワーカー数）で割り、ホスト全体で CPU 数を超える bcrypt プロセスを立てない
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+PASSWORD_HASH_WORKERS = int(os.getenv(
+    "PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+
+# プロセスプールで実行する関数（pickle 可能なモジュールレベル関数）
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Bounded process pool with async wrappers for hashing and verification
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.duration_seconds = metrics.Histogram()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # スレッドを多数抱えたワーカーからの fork を避ける
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            # Semaphore は最初に使ったイベントループに束縛される
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._slots_loop = loop
+        slots = self._slots
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.duration_seconds.observe(time.perf_counter() - start)
+            slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            # in_flight: プールに投入済み、waiting: 上限超過でループ上で待機中
+            "queue_depth": self.in_flight + self.waiting,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "duration_seconds": self.duration_seconds.snapshot(),
+        }
+
+
+password_hasher = PasswordHasher()
+metrics.register("password_hashing", password_hasher.stats)
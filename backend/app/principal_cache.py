@@ -0,0 +1,140 @@
+# app/principal_cache.py
+"""
+認証済みユーザー（プリンシパル）のキャッシュ
+
+get_current_user はトークンごとに JWT のデコードとユーザー検索を行うため、
+結果を軽量な Principal として TTL 付き LRU に保持する。
+ユーザーの更新・削除・無効化時は users ルーターが invalidate_user() で明示的に破棄する。
+キャッシュはワーカープロセスごとなので、破棄は pub/sub バスで他のワーカーにも流す
+（無効化したユーザーや降格した管理者が他ワーカーで TTL まで認可され続けないように）。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from app import metrics
+from app.pubsub import PubSubBus, bus as default_bus
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as seen by the routers (no ORM session attached)
+    """
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    full_name: Optional[str]
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        role = user.role.value if hasattr(user.role, "value") else user.role
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=role,
+            is_active=bool(user.is_active),
+            full_name=user.full_name,
+        )
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS,
+                 max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES,
+                 bus: Optional[PubSubBus] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bus = bus or default_bus
+        self._entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._origin = uuid.uuid4().hex  # 自分が流した無効化メッセージを見分ける
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bus.subscribe("principal_invalidate", self._on_invalidate)
+
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._discard(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, principal: Principal, token_expires_at: Optional[float] = None):
+        """Cache ``principal`` until the TTL or the token's own ``exp`` (epoch seconds)"""
+        ttl = self.ttl_seconds
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (time.monotonic() + ttl, principal)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of ``user_id`` here and on the other workers (after update, delete or deactivation)"""
+        self._invalidate_local(user_id)
+        self.bus.publish_threadsafe({"kind": "principal_invalidate", "origin": self._origin, "user_id": user_id})
+
+    def _on_invalidate(self, event: dict):
+        # 自ワーカーの分は invalidate_user() で反映済み
+        if event.get("origin") != self._origin:
+            self._invalidate_local(event["user_id"])
+
+    def _invalidate_local(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._discard(token)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[1].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[1].id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache()
+metrics.register("principal_cache", principal_cache.stats)
@@ -0,0 +1,522 @@
+# app/pubsub.py
+"""
+ワーカー間の pub/sub バス
+
+WebSocket 接続は uvicorn ワーカーごとに保持されるため、通知や投票数の更新は
+いったんバスに流し、全ワーカーが自分の接続へ配信する。バックエンドは PUBSUB_BACKEND で選ぶ:
+  memory    プロセス内のみ（既定。ワーカー 1 つ、または開発用）
+  postgres  PostgreSQL の LISTEN/NOTIFY（asyncpg）。ホストをまたいで動く。NOTIFY の上限を超える
+            メッセージは本文を pubsub_payloads テーブルに置き、その ID だけを通知する
+  unix      同一ホストのワーカー間を Unix ソケットで中継する。最初にロックを取ったワーカーが
+            ブローカーを兼ね、そのワーカーが落ちると残りのワーカーの 1 つが引き継ぐ
+
+メッセージは {"kind": ..., ...} の JSON 化できる dict。受信側は subscribe(kind, handler) で
+登録したハンドラー（イベントループ上で同期的に呼ばれる）が処理する。
+PUBSUB_MAX_MESSAGE_BYTES を超えるメッセージは他のワーカーへは送らず、送信元のワーカー内だけで配信する。
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "creative_hack_events")
+PUBSUB_SOCKET_PATH = os.getenv("PUBSUB_SOCKET_PATH", "/tmp/creative-hack-pubsub.sock")
+PUBSUB_MAX_PENDING = int(os.getenv("PUBSUB_MAX_PENDING", "10000"))
+_MAX_LINE_BYTES = 1 << 20
+PUBSUB_MAX_MESSAGE_BYTES = int(os.getenv("PUBSUB_MAX_MESSAGE_BYTES", str(_MAX_LINE_BYTES - 1)))
+
+# NOTIFY のペイロード上限は 8000 バイト
+POSTGRES_NOTIFY_MAX_BYTES = 7999
+# pubsub_payloads の行は全ワーカーが読み終えるのに十分な時間だけ残す
+POSTGRES_PAYLOAD_RETENTION_SECONDS = 300
+_RECONNECT_SECONDS = 1.0
+
+Handler = Callable[[dict], None]
+
+
+class PubSubBus(abc.ABC):
+    """
+    Base class: handler registry and local dispatch
+    """
+    backend = "base"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.local_only = 0
+        self.errors = 0
+
+    def subscribe(self, kind: str, handler: Handler):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    @abc.abstractmethod
+    def publish(self, message: dict):
+        """Queue ``message`` for every worker; non-blocking, call on the event loop"""
+
+    async def publish_confirmed(self, message: dict) -> bool:
+        """
+        publish() that waits until the backend has taken the message; False when
+        it could not be queued or sent, so the caller can retry it later
+        """
+        self.publish(message)
+        return True
+
+    def publish_threadsafe(self, message: dict):
+        """publish() that may also be called from request threads (sync endpoints)"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self.publish(message)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.publish(message)
+        else:
+            loop.call_soon_threadsafe(self.publish, message)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        self._loop = None
+
+    def _dispatch_raw(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            self.errors += 1
+            logger.error("pub/sub received a malformed message")
+            return
+        self._dispatch(message)
+
+    def _dispatch(self, message: dict):
+        self.received += 1
+        for handler in self._handlers.get(message.get("kind"), ()):
+            try:
+                handler(message)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"pub/sub handler for {message.get('kind')} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "published": self.published,
+            "received": self.received,
+            "pending": 0,
+            "dropped": self.dropped,
+            "local_only": self.local_only,
+            "errors": self.errors,
+        }
+
+
+class MemoryBus(PubSubBus):
+    backend = "memory"
+
+    def publish(self, message: dict):
+        self.published += 1
+        try:
+            # 送信側の処理を終えてから配信する（リモートのバックエンドと同じ順序になる）
+            asyncio.get_running_loop().call_soon(self._dispatch, message)
+        except RuntimeError:
+            self._dispatch(message)
+
+
+class RemoteBus(PubSubBus):
+    """
+    Base class for backends that reach other workers: an outbound queue drained by one sender task
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    def publish(self, message: dict):
+        self._enqueue(message, None)
+
+    async def publish_confirmed(self, message: dict) -> bool:
+        if self._outbox is None:
+            self._enqueue(message, None)
+            return True
+        sent = asyncio.get_running_loop().create_future()
+        if not self._enqueue(message, sent):
+            return False
+        return await sent
+
+    def _enqueue(self, message: dict, sent: Optional[asyncio.Future]) -> bool:
+        self.published += 1
+        if self._outbox is None:
+            # start() 前（スクリプトやベンチマーク）はこのプロセス内だけに配信する
+            self._dispatch(message)
+            return True
+        raw = json.dumps(message, separators=(",", ":"))
+        if len(raw.encode()) > PUBSUB_MAX_MESSAGE_BYTES:
+            # 何度送り直しても届かないので、送信元のワーカーでの配信をもって完了とする
+            logger.error(
+                "pub/sub %s message exceeds PUBSUB_MAX_MESSAGE_BYTES; delivering in this worker only",
+                message.get("kind"),
+            )
+            self._dispatch_locally(message)
+            if sent is not None:
+                sent.set_result(True)
+            return True
+        try:
+            self._outbox.put_nowait((raw, sent))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("pub/sub outbox is full; dropping %s message", message.get("kind"))
+            return False
+        return True
+
+    async def start(self):
+        await super().start()
+        self._outbox = asyncio.Queue(maxsize=PUBSUB_MAX_PENDING)
+        self._sender = asyncio.create_task(self._send_loop())
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            self._sender = None
+        # 送れなかったメッセージを待っている呼び出し元には失敗を返す
+        while self._outbox is not None and not self._outbox.empty():
+            _, sent = self._outbox.get_nowait()
+            if sent is not None and not sent.done():
+                sent.set_result(False)
+        self._outbox = None
+        await super().stop()
+
+    async def _send_loop(self):
+        while True:
+            raw, sent = await self._outbox.get()
+            ok = False
+            try:
+                await self._send(raw)
+                ok = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"pub/sub send failed ({self.backend}); delivering in this worker only: {e}")
+                self._dispatch_locally(raw)
+            finally:
+                if sent is not None and not sent.done():
+                    sent.set_result(ok)
+
+    @abc.abstractmethod
+    async def _send(self, raw: str):
+        """Hand ``raw`` to the backend; raise when it cannot be sent"""
+
+    def _dispatch_locally(self, message):
+        """Fallback when a message cannot reach the other workers: at least serve this worker's clients"""
+        self.local_only += 1
+        if isinstance(message, dict):
+            self._dispatch(message)
+        else:
+            self._dispatch_raw(message)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(pending=self._outbox.qsize() if self._outbox is not None else 0)
+        return stats
+
+
+class PostgresBus(RemoteBus):
+    """
+    LISTEN/NOTIFY on one dedicated asyncpg connection per worker
+
+    Messages over the NOTIFY limit are stored in pubsub_payloads and only
+    ``{"ref": id}`` is notified; receivers load the row before dispatching.
+    Notifications are handled in arrival order by a single receiver task so
+    that a referenced message is not overtaken by the small ones after it.
+    """
+    backend = "postgres"
+
+    def __init__(self, dsn: str, channel: str = PUBSUB_CHANNEL):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._conn = None
+        self._conn_lock = asyncio.Lock()
+        self._closing = False
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.stored = 0
+
+    async def start(self):
+        await super().start()
+        self._closing = False
+        self._conn_lock = asyncio.Lock()
+        self._inbox = asyncio.Queue()
+        self._receiver = asyncio.create_task(self._receive_loop())
+        await self._connect()
+
+    async def _connect(self):
+        import asyncpg
+
+        self._conn = await asyncpg.connect(self.dsn)
+        await self._conn.add_listener(self.channel, self._on_notify)
+        self._conn.add_termination_listener(self._on_terminated)
+        logger.info(f"pub/sub listening on PostgreSQL channel {self.channel}")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._inbox.put_nowait(payload)
+
+    async def _receive_loop(self):
+        while True:
+            raw = await self._inbox.get()
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                self.errors += 1
+                logger.error("pub/sub received a malformed message")
+                continue
+            if "ref" in message and "kind" not in message:
+                raw = await self._load_payload(message["ref"])
+                if raw is None:
+                    continue
+                self._dispatch_raw(raw)
+            else:
+                self._dispatch(message)
+
+    async def _load_payload(self, payload_id: int) -> Optional[str]:
+        try:
+            async with self._conn_lock:
+                if self._conn is None:
+                    raise ConnectionError("not connected")
+                raw = await self._conn.fetchval("SELECT payload FROM pubsub_payloads WHERE id = $1", payload_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"pub/sub could not load payload {payload_id}: {e}")
+            return None
+        if raw is None:
+            self.dropped += 1
+            logger.error(f"pub/sub payload {payload_id} is gone (older than the retention period?)")
+        return raw
+
+    def _on_terminated(self, connection):
+        self._conn = None
+        if not self._closing and self._reconnect_task is None:
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        try:
+            while not self._closing and self._conn is None:
+                await asyncio.sleep(_RECONNECT_SECONDS)
+                try:
+                    await self._connect()
+                except Exception as e:
+                    logger.warning(f"pub/sub reconnect to PostgreSQL failed: {e}")
+        finally:
+            self._reconnect_task = None
+
+    async def _send(self, raw: str):
+        async with self._conn_lock:
+            if self._conn is None:
+                raise ConnectionError("not connected to PostgreSQL")
+            notify = raw
+            if len(raw.encode()) > POSTGRES_NOTIFY_MAX_BYTES:
+                payload_id = await self._conn.fetchval(
+                    "INSERT INTO pubsub_payloads (payload) VALUES ($1) RETURNING id", raw
+                )
+                self.stored += 1
+                notify = json.dumps({"ref": payload_id})
+            await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, notify)
+            await self._purge_payloads()
+
+    async def _purge_payloads(self):
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._last_purge < POSTGRES_PAYLOAD_RETENTION_SECONDS / 5:
+            return
+        self._last_purge = loop.time()
+        await self._conn.execute(
+            "DELETE FROM pubsub_payloads WHERE created_at < now() - make_interval(secs => $1)",
+            float(POSTGRES_PAYLOAD_RETENTION_SECONDS),
+        )
+
+    async def stop(self):
+        self._closing = True
+        await super().stop()
+        for task in (self._reconnect_task, self._receiver):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._reconnect_task = None
+        self._receiver = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(stored_payloads=self.stored, connected=self._conn is not None)
+        return stats
+
+
+class UnixSocketBus(RemoteBus):
+    """
+    Same-host relay: one worker serves the socket and echoes every line to all workers
+    """
+    backend = "unix"
+
+    def __init__(self, path: str = PUBSUB_SOCKET_PATH):
+        super().__init__()
+        self.path = path
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: set = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._client: Optional[asyncio.Task] = None
+
+    @property
+    def is_broker(self) -> bool:
+        return self._server is not None
+
+    async def start(self):
+        await super().start()
+        self._connected = asyncio.Event()
+        self._client = asyncio.create_task(self._client_loop())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"pub/sub broker at {self.path} is not reachable yet")
+
+    async def _try_become_broker(self):
+        import fcntl
+
+        if self._server is not None:
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.path + ".lock", "a+")
+        try:
+            # ロックはプロセス終了時に OS が解放するので、ブローカーが落ちれば別のワーカーが取れる
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(
+            self._serve_peer, path=self.path, limit=_MAX_LINE_BYTES
+        )
+        logger.info(f"pub/sub broker listening on {self.path} (pid {os.getpid()})")
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for peer in list(self._peers):
+                    # 詰まったワーカーのために他のワーカーを待たせない
+                    if peer.transport.get_write_buffer_size() > _MAX_LINE_BYTES * 8:
+                        self.dropped += 1
+                        continue
+                    peer.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # CancelledError: ブローカー停止時。接続ハンドラーは正常終了させる
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _client_loop(self):
+        while True:
+            try:
+                await self._try_become_broker()
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=_MAX_LINE_BYTES)
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(_RECONNECT_SECONDS)
+                continue
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._dispatch_raw(line)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self._writer = None
+                self._connected.clear()
+                writer.close()
+            logger.warning("pub/sub broker connection lost; reconnecting")
+            await asyncio.sleep(_RECONNECT_SECONDS / 10)
+
+    async def _send(self, raw: str):
+        if self._writer is None:
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout=_RECONNECT_SECONDS * 2)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"pub/sub broker at {self.path} is not reachable")
+        self._writer.write(raw.encode() + b"\n")
+        await self._writer.drain()
+
+    async def stop(self):
+        await super().stop()
+        if self._client is not None:
+            self._client.cancel()
+            self._client = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(path=self.path, broker=self.is_broker, connected=self._writer is not None)
+        return stats
+
+
+def _postgres_dsn() -> str:
+    from sqlalchemy.engine import make_url
+    from app.database import SQLALCHEMY_DATABASE_URL
+
+    url = os.getenv("PUBSUB_DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+    # asyncpg はドライバー指定なしの postgresql:// を受け付ける
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_bus(backend: str = PUBSUB_BACKEND) -> PubSubBus:
+    if backend == "memory":
+        return MemoryBus()
+    if backend == "postgres":
+        return PostgresBus(_postgres_dsn())
+    if backend == "unix":
+        return UnixSocketBus()
+    raise ValueError(f"Unknown PUBSUB_BACKEND: {backend}")
+
+
+bus = create_bus()
+metrics.register("pubsub", bus.stats)
@@ -0,0 +1,193 @@
+# app/response_cache.py
+"""
+一覧レスポンスのリードスルーキャッシュ
+
+プラン一覧はユーザーに依存しない同じ結果をイベント中に何千回も返すため、
+ルートとクエリパラメーターをキーにシリアライズ済みの JSON をワーカーごとに保持する。
+件数は RESPONSE_CACHE_MAX_ENTRIES で上限を設けた LRU、各エントリは RESPONSE_CACHE_TTL_SECONDS で失効する
+（TTL 0 で無効）。
+
+各エントリには中身に応じたタグ（一覧の種類、含まれるプランの ID など）を付け、書き込み側は
+コミット後に影響するタグだけを invalidate() する。無効化は pub/sub バスで他のワーカーにも流す。
+取得中に同じタグが無効化された結果は保存しない（古い結果が TTL まで残るのを防ぐ）。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from app import metrics
+from app.pubsub import PubSubBus, bus as default_bus
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "5"))
+
+# タグ
+BUSINESS_PLANS = "business_plans"                     # 一覧の件数・並び（作成・削除）
+BUSINESS_PLANS_BY_VOTES = "business_plans:by_votes"   # sort=votes の並び（投票）
+BUSINESS_PLANS_SEARCH = "business_plans:search"       # 検索結果（本文の更新）
+BUSINESS_PLANS_SELECTED = "business_plans:selected"   # 選定済み一覧の件数（選定・選定解除）
+POC_PLANS = "poc_plans"                               # PoC 一覧の件数・絞り込み結果
+
+
+def business_plan_tag(business_plan_id: int) -> str:
+    return f"business_plan:{business_plan_id}"
+
+
+def poc_plan_tag(poc_plan_id: int) -> str:
+    return f"poc_plan:{poc_plan_id}"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: Dict[str, str]
+    tags: FrozenSet[str]
+    expires_at: float
+
+    def to_response(self) -> Response:
+        return Response(content=self.body, media_type="application/json",
+                        headers={**self.headers, "X-Cache": "hit"})
+
+
+class ResponseCache:
+    """
+    Bounded LRU of serialized responses with TTL expiry and tag-based invalidation
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 bus: Optional[PubSubBus] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.bus = bus or default_bus
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._generation = 0
+        self._invalidated_at: Dict[str, int] = {}  # タグ -> 最後に無効化された世代
+        self._lock = threading.Lock()
+        self._origin = uuid.uuid4().hex  # 自分が流した無効化メッセージを見分ける
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.stale_skips = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.bus.subscribe("cache_invalidate", self._on_invalidate)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key_for(request: Request) -> str:
+        return f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], int]:
+        """Return the live entry (or None) and the generation to pass to store()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry, self._generation
+
+    def lookup_request(self, request: Request) -> Tuple[Optional[str], Optional[CachedResponse], int]:
+        """lookup() keyed by the request's route and query string; the key is None when disabled"""
+        if not self.enabled:
+            return None, None, self._generation
+        key = self.key_for(request)
+        entry, generation = self.lookup(key)
+        return key, entry, generation
+
+    def store(self, key: str, body: bytes, headers: Dict[str, str], tags: Iterable[str], generation: int):
+        with self._lock:
+            tags = frozenset(tags)
+            if any(self._invalidated_at.get(tag, 0) > generation for tag in tags):
+                # 取得中に関係する書き込みがあった。古いかもしれない結果は保存しない
+                self.stale_skips += 1
+                return
+            self._remove(key)
+            entry = CachedResponse(body, headers, tags, time.monotonic() + self.ttl_seconds)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags: str):
+        """Drop every entry carrying one of ``tags`` here and on the other workers (call after commit)"""
+        if not tags:
+            return
+        self._invalidate_local(tags)
+        self.bus.publish_threadsafe({"kind": "cache_invalidate", "origin": self._origin, "tags": list(tags)})
+
+    def _on_invalidate(self, event: dict):
+        # 自ワーカーの分は invalidate() で反映済み（再度無効化すると直後の保存まで捨ててしまう）
+        if event.get("origin") != self._origin:
+            self._invalidate_local(event.get("tags", ()))
+
+    def _invalidate_local(self, tags: Iterable[str]):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._invalidated_at[tag] = self._generation
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def respond(self, key: Optional[str], generation: int, adapter: TypeAdapter, items,
+                headers: Dict[str, str], tags: Iterable[str]) -> Response:
+        """Serialize ``items`` with ``adapter``, cache the body under ``key`` and return it"""
+        body = adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+        if key is not None:
+            self.store(key, body, headers, tags, generation)
+        return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "miss"})
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "stale_skips": self.stale_skips,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache()
+metrics.register("response_cache", response_cache.stats)
@@ -1,10 +1,12 @@
 # app/routers/business_plans.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks, Request, Response
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import exists, func, select
+from pydantic import TypeAdapter
 from typing import List, Optional
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.models import BusinessPlan, Vote, User, Notification
 from app.schemas.schemas import (
     BusinessPlanCreate,
@@ -12,29 +14,45 @@ from app.schemas.schemas import (
     BusinessPlanUpdate,
     BusinessPlanDetailResponse,
     VoteCreate,
-    VoteResponse
+    VoteResponse,
+    VotedPlansResponse
 )
 from app.auth_logic import get_current_active_user, get_current_admin_user
-from app.websocket_manager import manager
-import json
+from app.principal_cache import Principal
+from app.vote_broadcast import vote_update_publisher
+from app.pagination import paginate, set_next_cursor, cursor_headers
+from app.search import business_plan_search
+from app.vote_ingest import vote_ingestor, PendingVote, VOTE_INGEST_TIMEOUT_SECONDS
+from app.voting import cast_vote, retract_vote
+from app.etag import business_plan_version, etag_matches, make_etag, not_modified, set_etag
+from app.response_cache import (
+    response_cache,
+    business_plan_tag,
+    BUSINESS_PLANS,
+    BUSINESS_PLANS_BY_VOTES,
+    BUSINESS_PLANS_SEARCH,
+    BUSINESS_PLANS_SELECTED,
+    POC_PLANS,
+)
 import asyncio
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 router = APIRouter()
 
+# votes/mine で一度に問い合わせられるプラン数の上限
+MAX_VOTE_LOOKUP_IDS = 500
+
+_business_plan_list = TypeAdapter(List[BusinessPlanResponse])
+
 # -----------------------------------------------------------------------------
 # Background task to broadcast vote updates
 # -----------------------------------------------------------------------------
 async def broadcast_vote_update(business_plan_id: int, vote_count: int):
     """
-    投票数が更新されたときに、WebSocket クライアントへ通知を行う
+    投票数が更新されたときに、そのプランまたは一覧を購読している WebSocket クライアントへ通知を行う
+    （VOTE_UPDATE_WINDOW_MS ごとにまとめて "vote_updates" フレームで送る）
     """
-    message = json.dumps({
-        "type": "vote_update",
-        "business_plan_id": business_plan_id,
-        "vote_count": vote_count
-    })
-    # ConnectionManager.broadcast は message だけを受け取る想定
-    await manager.broadcast(message)
+    vote_update_publisher.publish(business_plan_id, vote_count)
 
 
 # -----------------------------------------------------------------------------
@@ -46,22 +64,18 @@ async def broadcast_vote_update(business_plan_id: int, vote_count: int):
 )
 async def apply_to_plan(
     business_plan_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     ユーザーがビジネスプランに参加希望を送信するエンドポイント
     （実際の保存ロジックは未実装）
     """
-    business_plan = (
-        db.query(BusinessPlan)
-        .filter(BusinessPlan.id == business_plan_id)
-        .first()
-    )
+    business_plan = await db.get(BusinessPlan, business_plan_id)
     if not business_plan:
         raise HTTPException(status_code=404, detail="Business plan not found")
 
-    # オフライン用通知保存
+    # 通知はアウトボックス経由で WebSocket に配信される
     notification = Notification(
         user_id=business_plan.creator_id,
         title="新しい参加希望",
@@ -73,25 +87,7 @@ async def apply_to_plan(
         related_id=business_plan.id
     )
     db.add(notification)
-    db.commit()
-    db.refresh(notification)
-
-    # リアルタイム通知
-    payload = {
-        "type": "new_notification",
-        "notification_data": {
-            "id": notification.id,
-            "title": notification.title,
-            "message": notification.message,
-            "is_read": notification.is_read,
-            "created_at": notification.created_at.isoformat(),
-            "notification_type": notification.notification_type,
-            "related_id": notification.related_id,
-            "applicant_id": current_user.id,
-            "applicant_name": current_user.full_name
-        }
-    }
-    await manager.send_notification_to_user(business_plan.creator_id, payload)
+    await db.commit()
 
     return {"message": "参加希望を送信しました。"}
 
@@ -103,7 +99,7 @@ async def apply_to_plan(
 def create_business_plan(
     business_plan: BusinessPlanCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Create a new business plan
@@ -115,6 +111,8 @@ def create_business_plan(
     db.add(db_business_plan)
     db.commit()
     db.refresh(db_business_plan)
+    business_plan_search.refresh(db_business_plan)
+    response_cache.invalidate(BUSINESS_PLANS)
     return db_business_plan
 
 
@@ -122,36 +120,96 @@ def create_business_plan(
 # ビジネスプラン一覧取得
 # -----------------------------------------------------------------------------
 @router.get("/", response_model=List[BusinessPlanResponse])
-def read_business_plans(
+async def read_business_plans(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_voted_by_me: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Get all business plans with optional search
+
+    sort=votes で投票数の多い順、それ以外は作成順に並べる。
+    次ページは X-Next-Cursor ヘッダーの値を cursor に指定して取得する。
+    search 指定時は関連度順に並べ、skip/limit でページングする。
+    include_voted_by_me=true で各プランに voted_by_me（現在のユーザーが投票済みか）を付ける。
+    ユーザーに依存しない結果はレスポンスキャッシュから返す。
     """
-    query = db.query(BusinessPlan)
+    if include_voted_by_me:
+        cache_key, cached, generation = None, None, 0
+    else:
+        cache_key, cached, generation = response_cache.lookup_request(request)
+    if cached is not None:
+        return cached.to_response()
+
+    query = select(BusinessPlan)
 
     if search:
-        term = f"%{search}%"
-        query = query.filter(
-            (BusinessPlan.title.ilike(term)) |
-            (BusinessPlan.description.ilike(term))
+        query = await business_plan_search.apply(query, db, search)
+        query = query.offset(skip).limit(limit)
+    else:
+        if sort == "votes":
+            keys, descending = (BusinessPlan.vote_count, BusinessPlan.id), True
+        else:
+            keys, descending = (BusinessPlan.created_at, BusinessPlan.id), False
+        query = paginate(
+            query, keys, cursor=cursor, skip=skip, limit=limit, descending=descending,
+            dialect_name=db.get_bind().dialect.name
         )
 
-    plans = query.offset(skip).limit(limit).all()
+    if include_voted_by_me:
+        # 同じ SELECT に EXISTS 列を足す（uq_votes_user_plan のインデックスで引く）
+        voted = exists().where(
+            Vote.user_id == current_user.id, Vote.business_plan_id == BusinessPlan.id
+        ).correlate(BusinessPlan)
+        plans = []
+        for plan, voted_by_me in (await db.execute(query.add_columns(voted.label("voted_by_me")))).all():
+            plan.voted_by_me = voted_by_me
+            plans.append(plan)
+    else:
+        plans = (await db.execute(query)).scalars().all()
+
+    if not search:
+        set_next_cursor(response, plans, keys, limit)
+
+    tags = {BUSINESS_PLANS, *(business_plan_tag(plan.id) for plan in plans)}
+    if search:
+        tags.add(BUSINESS_PLANS_SEARCH)
+    elif sort == "votes":
+        tags.add(BUSINESS_PLANS_BY_VOTES)
+    return response_cache.respond(
+        cache_key, generation, _business_plan_list, plans,
+        headers=cursor_headers(response), tags=tags
+    )
 
-    # 各プランに投票数を設定
-    for plan in plans:
-        plan.vote_count = (
-            db.query(Vote)
-            .filter(Vote.business_plan_id == plan.id)
-            .count()
-        )
 
-    return plans
+# -----------------------------------------------------------------------------
+# 現在のユーザーが投票済みのプラン ID（一覧の投票ボタン用）
+# -----------------------------------------------------------------------------
+@router.get("/votes/mine", response_model=VotedPlansResponse)
+async def read_my_votes(
+    plan_ids: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    IDs of the business plans the current user has voted for.
+    With plan_ids (?plan_ids=1&plan_ids=2) only that subset is checked;
+    replaces one /{id}/user-vote call per plan
+    """
+    query = select(Vote.business_plan_id).where(Vote.user_id == current_user.id)
+    if plan_ids is not None:
+        if len(plan_ids) > MAX_VOTE_LOOKUP_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_VOTE_LOOKUP_IDS} plan_ids are allowed")
+        query = query.where(Vote.business_plan_id.in_(plan_ids))
+    result = await db.execute(query.order_by(Vote.business_plan_id))
+    return {"business_plan_ids": result.scalars().all()}
 
 
 # -----------------------------------------------------------------------------
@@ -160,26 +218,36 @@ def read_business_plans(
 @router.get("/{business_plan_id}", response_model=BusinessPlanDetailResponse)
 def read_business_plan(
     business_plan_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get a specific business plan by ID
+    Get a specific business plan by ID (ETag / If-None-Match aware)
     """
+    # バージョンだけを先に読み、一致すれば本体を読まずに 304
+    version = db.execute(business_plan_version(business_plan_id)).one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Business plan not found")
+    etag = make_etag("business_plan", business_plan_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # レスポンスが辿る関連はすべて先読みし、投票数・PoC 数によらずクエリ数を一定にする
     business_plan = (
         db.query(BusinessPlan)
+        .options(
+            joinedload(BusinessPlan.creator),
+            selectinload(BusinessPlan.poc_plans),
+        )
         .filter(BusinessPlan.id == business_plan_id)
         .first()
     )
     if not business_plan:
         raise HTTPException(status_code=404, detail="Business plan not found")
 
-    business_plan.vote_count = (
-        db.query(Vote)
-        .filter(Vote.business_plan_id == business_plan.id)
-        .count()
-    )
-
+    set_etag(response, etag)
     return business_plan
 
 
@@ -191,7 +259,7 @@ def update_business_plan(
     business_plan_id: int,
     update: BusinessPlanUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Update a business plan
@@ -207,11 +275,17 @@ def update_business_plan(
     if db_plan.creator_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to update")
 
-    for field, value in update.dict(exclude_unset=True).items():
+    changes = update.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(db_plan, field, value)
 
     db.commit()
     db.refresh(db_plan)
+    business_plan_search.refresh(db_plan)
+    tags = [business_plan_tag(business_plan_id), BUSINESS_PLANS_SEARCH]
+    if "is_selected" in changes:
+        tags.append(BUSINESS_PLANS_SELECTED)
+    response_cache.invalidate(*tags)
     return db_plan
 
 
@@ -222,7 +296,7 @@ def update_business_plan(
 def delete_business_plan(
     business_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Delete a business plan
@@ -240,6 +314,9 @@ def delete_business_plan(
 
     db.delete(db_plan)
     db.commit()
+    business_plan_search.discard(business_plan_id)
+    # 紐づいていた PoC の business_plan_id も NULL になるので、PoC 一覧の絞り込み結果も捨てる
+    response_cache.invalidate(BUSINESS_PLANS, business_plan_tag(business_plan_id), POC_PLANS)
     return None
 
 
@@ -251,53 +328,58 @@ def vote_for_business_plan(
     business_plan_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Vote for a business plan
     """
-    plan = (
-        db.query(BusinessPlan)
-        .filter(BusinessPlan.id == business_plan_id)
-        .first()
-    )
-    if not plan:
-        raise HTTPException(status_code=404, detail="Business plan not found")
-
-    existing = (
-        db.query(Vote)
-        .filter(
-            Vote.user_id == current_user.id,
-            Vote.business_plan_id == business_plan_id
+    # グループコミットモード：書き込みは取り込みスレッドがまとめて行う
+    if vote_ingestor.enabled:
+        plan = (
+            db.query(BusinessPlan)
+            .filter(BusinessPlan.id == business_plan_id)
+            .first()
         )
-        .first()
-    )
-    if existing:
+        if not plan:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        pending = PendingVote(
+            user_id=current_user.id,
+            user_full_name=current_user.full_name,
+            business_plan_id=business_plan_id,
+            plan_title=plan.title,
+            plan_creator_id=plan.creator_id,
+        )
+        # 書き込み完了を待つ間コネクションを保持しない
+        db.close()
+        try:
+            result = vote_ingestor.submit(pending).result(timeout=VOTE_INGEST_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # 取り込みが詰まっている。投票は後で書き込まれることがあるので、再試行すると 400 になりうる
+            raise HTTPException(
+                status_code=503,
+                detail="Vote ingestion is overloaded; please retry",
+                headers={"Retry-After": "1"},
+            )
+        if result.plan_missing:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+        if result.vote is None:
+            raise HTTPException(status_code=400, detail="Already voted")
+        response_cache.invalidate(business_plan_tag(business_plan_id), BUSINESS_PLANS_BY_VOTES)
+        background_tasks.add_task(broadcast_vote_update, business_plan_id, result.vote_count)
+        return result.vote
+
+    # プラン確認・二重投票の判定・カウンタ・通知を 1 文で（PostgreSQL）
+    result = cast_vote(db, current_user.id, current_user.full_name, business_plan_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Business plan not found")
+    if result.vote is None:
         raise HTTPException(status_code=400, detail="Already voted")
-
-    vote = Vote(user_id=current_user.id, business_plan_id=business_plan_id)
-    db.add(vote)
-
-    notification = Notification(
-        user_id=plan.creator_id,
-        title="New Vote",
-        message=f"{current_user.full_name} voted for your business plan: {plan.title}",
-        notification_type="vote",
-        related_id=business_plan_id
-    )
-    db.add(notification)
-
     db.commit()
-    db.refresh(vote)
+    response_cache.invalidate(business_plan_tag(business_plan_id), BUSINESS_PLANS_BY_VOTES)
 
-    new_count = (
-        db.query(Vote)
-        .filter(Vote.business_plan_id == business_plan_id)
-        .count()
-    )
-    background_tasks.add_task(broadcast_vote_update, business_plan_id, new_count)
+    background_tasks.add_task(broadcast_vote_update, business_plan_id, result.vote_count)
 
-    return vote
+    return result.vote
 
 
 # -----------------------------------------------------------------------------
@@ -308,67 +390,52 @@ def remove_vote_from_business_plan(
     business_plan_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Remove vote from a business plan
     """
-    plan = (
-        db.query(BusinessPlan)
-        .filter(BusinessPlan.id == business_plan_id)
-        .first()
-    )
-    if not plan:
+    # DELETE ... RETURNING とカウンタの減算を 1 文で（PostgreSQL）
+    result = retract_vote(db, current_user.id, business_plan_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Business plan not found")
-
-    vote = (
-        db.query(Vote)
-        .filter(
-            Vote.user_id == current_user.id,
-            Vote.business_plan_id == business_plan_id
-        )
-        .first()
-    )
-    if not vote:
+    if result.vote is None:
         raise HTTPException(status_code=400, detail="You have not voted")
-
-    db.delete(vote)
     db.commit()
+    response_cache.invalidate(business_plan_tag(business_plan_id), BUSINESS_PLANS_BY_VOTES)
 
-    new_count = (
-        db.query(Vote)
-        .filter(Vote.business_plan_id == business_plan_id)
-        .count()
-    )
-    background_tasks.add_task(broadcast_vote_update, business_plan_id, new_count)
+    background_tasks.add_task(broadcast_vote_update, business_plan_id, result.vote_count)
 
     return None
 
 
 # -----------------------------------------------------------------------------
-# 管理者用：特定プランの全投票取得
+# 特定プランの投票一覧（詳細レスポンスには件数のみ含める）
 # -----------------------------------------------------------------------------
 @router.get("/{business_plan_id}/votes", response_model=List[VoteResponse])
 def get_business_plan_votes(
     business_plan_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get all votes for a business plan (admin only)
+    Get the votes for a business plan (oldest first, cursor via X-Next-Cursor)
     """
-    plan = (
-        db.query(BusinessPlan)
-        .filter(BusinessPlan.id == business_plan_id)
-        .first()
-    )
-    if not plan:
+    plan_exists = db.query(exists().where(BusinessPlan.id == business_plan_id)).scalar()
+    if not plan_exists:
         raise HTTPException(status_code=404, detail="Business plan not found")
-    return (
-        db.query(Vote)
-        .filter(Vote.business_plan_id == business_plan_id)
-        .all()
-    )
+
+    keys = (Vote.created_at, Vote.id)
+    votes = paginate(
+        db.query(Vote).filter(Vote.business_plan_id == business_plan_id),
+        keys, cursor=cursor, skip=skip, limit=limit
+    ).all()
+    set_next_cursor(response, votes, keys, limit)
+    return votes
 
 
 # -----------------------------------------------------------------------------
@@ -378,7 +445,7 @@ def get_business_plan_votes(
 def check_user_vote(
     business_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Check if the current user has voted for a specific business plan
@@ -408,7 +475,7 @@ def check_user_vote(
 def select_business_plan(
     business_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """
     Select a business plan for the next phase (admin only)
@@ -433,6 +500,7 @@ def select_business_plan(
 
     db.commit()
     db.refresh(plan)
+    response_cache.invalidate(business_plan_tag(business_plan_id), BUSINESS_PLANS_SELECTED)
     return plan
 
 
@@ -443,7 +511,7 @@ def select_business_plan(
 def unselect_business_plan(
     business_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """
     Unselect a business plan (admin only)
@@ -458,6 +526,7 @@ def unselect_business_plan(
     plan.is_selected = False
     db.commit()
     db.refresh(plan)
+    response_cache.invalidate(business_plan_tag(business_plan_id), BUSINESS_PLANS_SELECTED)
     return plan
 
 
@@ -465,22 +534,24 @@ def unselect_business_plan(
 # 選定済プラン一覧
 # -----------------------------------------------------------------------------
 @router.get("/selected/list", response_model=List[BusinessPlanResponse])
-def get_selected_business_plans(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+async def get_selected_business_plans(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Get all selected business plans
     """
-    plans = (
-        db.query(BusinessPlan)
+    cache_key, cached, generation = response_cache.lookup_request(request)
+    if cached is not None:
+        return cached.to_response()
+
+    result = await db.execute(
+        select(BusinessPlan)
         .filter(BusinessPlan.is_selected == True)
-        .all()
     )
-    for plan in plans:
-        plan.vote_count = (
-            db.query(Vote)
-            .filter(Vote.business_plan_id == plan.id)
-            .count()
-        )
-    return plans
\ No newline at end of file
+    plans = result.scalars().all()
+    return response_cache.respond(
+        cache_key, generation, _business_plan_list, plans, headers={},
+        tags={BUSINESS_PLANS_SELECTED, *(business_plan_tag(plan.id) for plan in plans)}
+    )
\ No newline at end of file
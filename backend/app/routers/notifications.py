@@ -1,52 +1,141 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
-from app.models.models import Notification, User
-from app.schemas.schemas import NotificationResponse, NotificationUpdate
-from app.auth_logic import get_current_active_user
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select, update
+from typing import List, Optional, Union
+from app.database import get_db, get_async_db
+from app.models.models import Notification, User, BusinessPlan, PoCPlan
+from app.schemas.schemas import (
+    NotificationResponse,
+    NotificationUpdate,
+    NotificationBulkRead,
+    NotificationBulkUpdateResponse,
+    BulkNotificationCreate,
+    BulkNotificationResponse,
+    NotificationAudience
+)
+from app.auth_logic import get_current_active_user, get_current_admin_user
+from app.principal_cache import Principal
+from app.pagination import paginate, set_next_cursor
+from app.bulk_notifications import insert_bulk_notifications, audience_delivery
+from app.unread_counter import adjust_unread_count, bump_notifications_version
+from app.etag import etag_matches, make_etag, not_modified, notifications_version, set_etag
 
 router = APIRouter()
 
 @router.get("/", response_model=List[NotificationResponse])
-def read_notifications(
+async def read_notifications(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     unread_only: bool = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get all notifications for the current user
+    Get all notifications for the current user (newest first, cursor via X-Next-Cursor, ETag aware)
     """
-    query = db.query(Notification).filter(Notification.user_id == current_user.id)
+    # ポーリングの大半は変化なし。ユーザー行の版カウンタ 1 つで判定して 304 を返す
+    version = await db.scalar(notifications_version(current_user.id))
+    etag = make_etag("notifications", current_user.id, skip, limit, unread_only, cursor, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    query = select(Notification).filter(Notification.user_id == current_user.id)
     
     if unread_only:
         query = query.filter(Notification.is_read == False)
     
-    query = query.order_by(Notification.created_at.desc())
-    notifications = query.offset(skip).limit(limit).all()
+    keys = (Notification.created_at, Notification.id)
+    result = await db.execute(paginate(
+        query, keys, cursor=cursor, skip=skip, limit=limit, descending=True,
+        dialect_name=db.get_bind().dialect.name
+    ))
+    notifications = result.scalars().all()
+    set_next_cursor(response, notifications, keys, limit)
+    set_etag(response, etag)
     return notifications
 
 @router.get("/unread-count", response_model=int)
-def get_unread_notification_count(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+async def get_unread_notification_count(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Get count of unread notifications for the current user
+    (also pushed over WebSocket as {"type": "unread_count"} whenever it changes)
+    """
+    count = await db.scalar(
+        select(User.unread_notification_count).filter(User.id == current_user.id)
+    )
+    return count or 0
+
+@router.post("/bulk", response_model=BulkNotificationResponse, status_code=status.HTTP_201_CREATED)
+async def create_bulk_notification(
+    request: BulkNotificationCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
     """
-    count = db.query(Notification).filter(
-        Notification.user_id == current_user.id,
-        Notification.is_read == False
-    ).count()
-    return count
+    Notify every user of an audience at once (admin only)
+    """
+    if request.audience == NotificationAudience.DEPARTMENT and not request.department:
+        raise HTTPException(status_code=400, detail="department is required for this audience")
+    if request.audience == NotificationAudience.PLAN_VOTERS:
+        if request.business_plan_id is None:
+            raise HTTPException(status_code=400, detail="business_plan_id is required for this audience")
+        if await db.get(BusinessPlan, request.business_plan_id) is None:
+            raise HTTPException(status_code=404, detail="Business plan not found")
+    if request.audience == NotificationAudience.POC_TEAM:
+        if request.poc_plan_id is None:
+            raise HTTPException(status_code=400, detail="poc_plan_id is required for this audience")
+        if await db.get(PoCPlan, request.poc_plan_id) is None:
+            raise HTTPException(status_code=404, detail="PoC plan not found")
+
+    # 宛先の抽出と通知の作成は INSERT ... SELECT の 1 文
+    unread_counts = await insert_bulk_notifications(db, request)
+    await db.commit()
+
+    # 宛先と新しい未読数をバスに 1 回だけ流し、各ワーカーが接続中の宛先へ配信する
+    if unread_counts:
+        audience_delivery.publish(request, unread_counts)
+
+    return {"audience": request.audience, "recipients": len(unread_counts)}
+
+def _mark_read(db: Session, user_id: int, *conditions) -> int:
+    """Set-based mark-as-read of the user's unread notifications matching ``conditions``"""
+    ids = db.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == False, *conditions)
+        .values(is_read=True)
+        .returning(Notification.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if ids:
+        adjust_unread_count(db, user_id, -len(ids))
+    return len(ids)
+
+# /{notification_id} より前に宣言する（"read" が ID として解釈されないように）
+@router.put("/read", response_model=NotificationBulkUpdateResponse)
+def mark_as_read_by_ids(
+    request: NotificationBulkRead,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Mark the given notifications of the current user as read (ids of other users are ignored)
+    """
+    updated = _mark_read(db, current_user.id, Notification.id.in_(request.ids)) if request.ids else 0
+    db.commit()
+    return {"updated": updated}
 
 @router.get("/{notification_id}", response_model=NotificationResponse)
 def read_notification(
     notification_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Get a specific notification by ID
@@ -66,7 +155,7 @@ def update_notification(
     notification_id: int,
     notification_update: NotificationUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Update a notification (mark as read/unread)
@@ -88,36 +177,41 @@ def update_notification(
     db.refresh(notification)
     return notification
 
-@router.put("/", response_model=List[NotificationResponse])
+@router.put("/", response_model=Union[List[NotificationResponse], NotificationBulkUpdateResponse])
 def mark_all_as_read(
+    response: Response,
+    mode: str = "page",
+    limit: int = 100,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Mark all notifications as read
+    Mark all notifications as read with one UPDATE.
+    mode=page returns the newest ``limit`` notifications (cursor via X-Next-Cursor),
+    mode=count returns only {"updated": n}
     """
-    notifications = db.query(Notification).filter(
-        Notification.user_id == current_user.id,
-        Notification.is_read == False
-    ).all()
-    
-    for notification in notifications:
-        notification.is_read = True
-    
+    if mode not in ("page", "count"):
+        raise HTTPException(status_code=400, detail="mode must be 'page' or 'count'")
+
+    updated = _mark_read(db, current_user.id)
     db.commit()
-    
-    # Return updated notifications
-    updated_notifications = db.query(Notification).filter(
-        Notification.user_id == current_user.id
-    ).order_by(Notification.created_at.desc()).all()
-    
-    return updated_notifications
+
+    if mode == "count":
+        return {"updated": updated}
+
+    keys = (Notification.created_at, Notification.id)
+    notifications = paginate(
+        db.query(Notification).filter(Notification.user_id == current_user.id),
+        keys, limit=limit, descending=True
+    ).all()
+    set_next_cursor(response, notifications, keys, limit)
+    return notifications
 
 @router.delete("/{notification_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_notification(
     notification_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Delete a notification
@@ -137,11 +231,22 @@ def delete_notification(
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
 def delete_all_notifications(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Delete all notifications for the current user
     """
-    db.query(Notification).filter(Notification.user_id == current_user.id).delete()
+    # 0 で上書きすると、同時に追加された未読通知の分だけカウンタがずれるので、消した未読の数だけ減らす
+    deleted = db.execute(
+        delete(Notification)
+        .where(Notification.user_id == current_user.id)
+        .returning(Notification.is_read)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    unread = sum(1 for is_read in deleted if not is_read)
+    if unread:
+        adjust_unread_count(db, current_user.id, -unread)
+    elif deleted:
+        bump_notifications_version(db, [current_user.id])
     db.commit()
     return None
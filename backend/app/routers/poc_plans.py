@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from pydantic import TypeAdapter
 from typing import List, Optional
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.models import PoCPlan, TeamMember, User, Notification, BusinessPlan
 from app.schemas.schemas import (
     PoCPlanCreate, 
@@ -13,14 +15,21 @@ from app.schemas.schemas import (
     TeamMemberResponse
 )
 from app.auth_logic import get_current_active_user, get_current_admin_user
+from app.principal_cache import Principal
+from app.pagination import paginate, set_next_cursor, cursor_headers
+from app.search import poc_plan_search
+from app.response_cache import response_cache, poc_plan_tag, POC_PLANS
+from app.etag import etag_matches, make_etag, not_modified, poc_plan_version, set_etag
 
 router = APIRouter()
 
+_poc_plan_list = TypeAdapter(List[PoCPlanResponse])
+
 @router.post("/", response_model=PoCPlanResponse)
 def create_poc_plan(
     poc_plan: PoCPlanCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Create a new PoC plan
@@ -40,6 +49,7 @@ def create_poc_plan(
     db.add(db_poc_plan)
     db.commit()
     db.refresh(db_poc_plan)
+    poc_plan_search.refresh(db_poc_plan)
     
     # Automatically add creator as a team member
     team_member = TeamMember(
@@ -49,30 +59,38 @@ def create_poc_plan(
     )
     db.add(team_member)
     db.commit()
+    response_cache.invalidate(POC_PLANS)
     
     return db_poc_plan
 
 @router.get("/", response_model=List[PoCPlanResponse])
-def read_poc_plans(
+async def read_poc_plans(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
     technical_only: Optional[bool] = None,
     business_plan_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get all PoC plans with optional filters
+    Get all PoC plans with optional filters (ordered by creation, cursor via X-Next-Cursor)
     """
-    query = db.query(PoCPlan)
-    
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (PoCPlan.title.ilike(search_term)) |
-            (PoCPlan.description.ilike(search_term))
-        )
+    cache_key, cached, generation = response_cache.lookup_request(request)
+    if cached is not None:
+        return cached.to_response()
+
+    # チームメンバー数はサブクエリで同時に取得
+    team_member_count = (
+        select(func.count(TeamMember.id))
+        .where(TeamMember.poc_plan_id == PoCPlan.id)
+        .correlate(PoCPlan)
+        .scalar_subquery()
+    )
+    query = select(PoCPlan, team_member_count)
     
     if technical_only is not None:
         query = query.filter(PoCPlan.is_technical_only == technical_only)
@@ -80,30 +98,66 @@ def read_poc_plans(
     if business_plan_id:
         query = query.filter(PoCPlan.business_plan_id == business_plan_id)
     
-    poc_plans = query.offset(skip).limit(limit).all()
+    keys = (PoCPlan.created_at, PoCPlan.id)
+    if search:
+        # 関連度順（skip/limit でページング）
+        query = await poc_plan_search.apply(query, db, search)
+        query = query.offset(skip).limit(limit)
+    else:
+        query = paginate(
+            query, keys, cursor=cursor, skip=skip, limit=limit,
+            dialect_name=db.get_bind().dialect.name
+        )
     
-    # Add team member count to each PoC plan
-    for plan in poc_plans:
-        plan.team_member_count = db.query(TeamMember).filter(TeamMember.poc_plan_id == plan.id).count()
+    poc_plans = []
+    for plan, member_count in (await db.execute(query)).all():
+        plan.team_member_count = member_count
+        poc_plans.append(plan)
     
-    return poc_plans
+    if not search:
+        set_next_cursor(response, poc_plans, keys, limit)
+    return response_cache.respond(
+        cache_key, generation, _poc_plan_list, poc_plans, headers=cursor_headers(response),
+        tags={POC_PLANS, *(poc_plan_tag(plan.id) for plan in poc_plans)}
+    )
 
 @router.get("/{poc_plan_id}", response_model=PoCPlanDetailResponse)
 def read_poc_plan(
     poc_plan_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get a specific PoC plan by ID
+    Get a specific PoC plan by ID (ETag / If-None-Match aware)
     """
-    poc_plan = db.query(PoCPlan).filter(PoCPlan.id == poc_plan_id).first()
+    # バージョンだけを先に読み、一致すれば本体を読まずに 304
+    version = db.execute(poc_plan_version(poc_plan_id)).one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="PoC plan not found")
+    etag = make_etag("poc_plan", poc_plan_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # レスポンスが辿る関連はすべて先読みし、チームの人数によらずクエリ数を一定にする
+    poc_plan = (
+        db.query(PoCPlan)
+        .options(
+            joinedload(PoCPlan.creator),
+            joinedload(PoCPlan.business_plan),
+            selectinload(PoCPlan.team_members).joinedload(TeamMember.user),
+        )
+        .filter(PoCPlan.id == poc_plan_id)
+        .first()
+    )
     if poc_plan is None:
         raise HTTPException(status_code=404, detail="PoC plan not found")
     
     # Add team member count
-    poc_plan.team_member_count = db.query(TeamMember).filter(TeamMember.poc_plan_id == poc_plan.id).count()
+    poc_plan.team_member_count = len(poc_plan.team_members)
     
+    set_etag(response, etag)
     return poc_plan
 
 @router.put("/{poc_plan_id}", response_model=PoCPlanResponse)
@@ -111,7 +165,7 @@ def update_poc_plan(
     poc_plan_id: int,
     poc_plan_update: PoCPlanUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Update a PoC plan
@@ -139,13 +193,16 @@ def update_poc_plan(
     
     db.commit()
     db.refresh(db_poc_plan)
+    poc_plan_search.refresh(db_poc_plan)
+    # 絞り込み条件の列も変わりうるので一覧全体を無効化
+    response_cache.invalidate(POC_PLANS)
     return db_poc_plan
 
 @router.delete("/{poc_plan_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_poc_plan(
     poc_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Delete a PoC plan
@@ -160,6 +217,8 @@ def delete_poc_plan(
     
     db.delete(db_poc_plan)
     db.commit()
+    poc_plan_search.discard(poc_plan_id)
+    response_cache.invalidate(POC_PLANS)
     return None
 
 @router.post("/{poc_plan_id}/team", response_model=TeamMemberResponse)
@@ -167,7 +226,7 @@ def join_poc_team(
     poc_plan_id: int,
     team_member: TeamMemberCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Join a PoC team
@@ -206,13 +265,14 @@ def join_poc_team(
     
     db.commit()
     db.refresh(db_team_member)
+    response_cache.invalidate(poc_plan_tag(poc_plan_id))
     return db_team_member
 
 @router.delete("/{poc_plan_id}/team", status_code=status.HTTP_204_NO_CONTENT)
 def leave_poc_team(
     poc_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Leave a PoC team
@@ -249,13 +309,14 @@ def leave_poc_team(
         db.add(notification)
     
     db.commit()
+    response_cache.invalidate(poc_plan_tag(poc_plan_id))
     return None
 
 @router.get("/{poc_plan_id}/team", response_model=List[TeamMemberResponse])
 def get_poc_team_members(
     poc_plan_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Get all team members for a PoC plan
@@ -273,7 +334,7 @@ def remove_team_member(
     poc_plan_id: int,
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Remove a team member (creator or admin only)
@@ -313,4 +374,5 @@ def remove_team_member(
     db.add(notification)
     
     db.commit()
+    response_cache.invalidate(poc_plan_tag(poc_plan_id))
     return None
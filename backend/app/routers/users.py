@@ -1,98 +1,243 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
-from typing import List, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from typing import List, Any, Optional
 
-from app.database import get_db
-from app.models.models import User
-from app.schemas.schemas import UserResponse, UserUpdate, UserDetailResponse
-from app.auth_logic import get_current_active_user, get_current_admin_user, get_password_hash
+from app.database import get_db, get_async_db
+from app.models.models import User, BusinessPlan, PoCPlan, Vote, TeamMember, Notification
+from app.schemas.schemas import (
+    UserResponse,
+    UserUpdate,
+    UserSummaryResponse,
+    BusinessPlanResponse,
+    PoCPlanResponse,
+    VoteResponse,
+    TeamMemberResponse
+)
+from app.auth_logic import get_current_active_user, get_current_admin_user, get_password_hash_async
+from app.principal_cache import Principal, principal_cache
+from app.pagination import paginate, set_next_cursor
 
 router = APIRouter()
 
-@router.get("/me", response_model=UserDetailResponse)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+# プロフィールに載せる件数（1 本の SELECT のスカラーサブクエリで数える）
+_SUMMARY_COUNTS = {
+    "business_plan_count": (BusinessPlan.id, BusinessPlan.creator_id),
+    "poc_plan_count": (PoCPlan.id, PoCPlan.creator_id),
+    "vote_count": (Vote.id, Vote.user_id),
+    "team_membership_count": (TeamMember.id, TeamMember.user_id),
+    "notification_count": (Notification.id, Notification.user_id),
+}
+
+
+def _user_summary(db: Session, user_id: int) -> Optional[User]:
+    """Load a user with the history counts of UserSummaryResponse set on it"""
+    row = db.execute(
+        select(User, *[
+            select(func.count(column)).where(owner == User.id).scalar_subquery()
+            for column, owner in _SUMMARY_COUNTS.values()
+        ]).where(User.id == user_id)
+    ).one_or_none()
+    if row is None:
+        return None
+    user = row[0]
+    for name, value in zip(_SUMMARY_COUNTS, row[1:]):
+        setattr(user, name, value)
+    return user
+
+
+def _require_user(db: Session, user_id: int):
+    if db.get(User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+
+@router.get("/me", response_model=UserSummaryResponse)
+def read_users_me(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
     """
-    Get current user information
+    Get current user information with history counts
     """
-    return current_user
+    user = _user_summary(db, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 @router.put("/me", response_model=UserResponse)
-def update_user_me(
+async def update_user_me(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
     Update current user information
     """
+    user = await db.get(User, current_user.id)
+
     # Update user fields
     for field, value in user_update.dict(exclude_unset=True).items():
         if field == "password" and value:
-            setattr(current_user, "hashed_password", get_password_hash(value))
+            setattr(user, "hashed_password", await get_password_hash_async(value))
         elif value is not None:
-            setattr(current_user, field, value)
+            setattr(user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate_user(user.id)
+    return user
 
 @router.get("/", response_model=List[UserResponse])
 def read_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get all users
+    Get all users (ordered by registration, cursor via X-Next-Cursor)
     """
-    users = db.query(User).offset(skip).limit(limit).all()
+    keys = (User.created_at, User.id)
+    users = paginate(db.query(User), keys, cursor=cursor, skip=skip, limit=limit).all()
+    set_next_cursor(response, users, keys, limit)
     return users
 
-@router.get("/{user_id}", response_model=UserDetailResponse)
+@router.get("/{user_id}", response_model=UserSummaryResponse)
 def read_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """
-    Get user by ID
+    Get user by ID with history counts
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = _user_summary(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+@router.get("/{user_id}/business_plans", response_model=List[BusinessPlanResponse])
+def read_user_business_plans(
+    user_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Get the business plans created by a user (newest first, cursor via X-Next-Cursor)
+    """
+    _require_user(db, user_id)
+    keys = (BusinessPlan.created_at, BusinessPlan.id)
+    plans = paginate(
+        db.query(BusinessPlan).filter(BusinessPlan.creator_id == user_id),
+        keys, cursor=cursor, skip=skip, limit=limit, descending=True
+    ).all()
+    set_next_cursor(response, plans, keys, limit)
+    return plans
+
+@router.get("/{user_id}/poc_plans", response_model=List[PoCPlanResponse])
+def read_user_poc_plans(
+    user_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Get the PoC plans created by a user (newest first, cursor via X-Next-Cursor)
+    """
+    _require_user(db, user_id)
+    keys = (PoCPlan.created_at, PoCPlan.id)
+    plans = paginate(
+        db.query(PoCPlan).filter(PoCPlan.creator_id == user_id),
+        keys, cursor=cursor, skip=skip, limit=limit, descending=True
+    ).all()
+    set_next_cursor(response, plans, keys, limit)
+    return plans
+
+@router.get("/{user_id}/votes", response_model=List[VoteResponse])
+def read_user_votes(
+    user_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Get the votes cast by a user (newest first, cursor via X-Next-Cursor)
+    """
+    _require_user(db, user_id)
+    keys = (Vote.created_at, Vote.id)
+    votes = paginate(
+        db.query(Vote).filter(Vote.user_id == user_id),
+        keys, cursor=cursor, skip=skip, limit=limit, descending=True
+    ).all()
+    set_next_cursor(response, votes, keys, limit)
+    return votes
+
+@router.get("/{user_id}/team_memberships", response_model=List[TeamMemberResponse])
+def read_user_team_memberships(
+    user_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Get the PoC teams a user belongs to (newest first, cursor via X-Next-Cursor)
+    """
+    _require_user(db, user_id)
+    keys = (TeamMember.created_at, TeamMember.id)
+    memberships = paginate(
+        db.query(TeamMember).filter(TeamMember.user_id == user_id),
+        keys, cursor=cursor, skip=skip, limit=limit, descending=True
+    ).all()
+    set_next_cursor(response, memberships, keys, limit)
+    return memberships
+
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """
     Update user (admin only)
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Update user fields
     for field, value in user_update.dict(exclude_unset=True).items():
         if field == "password" and value:
-            setattr(user, "hashed_password", get_password_hash(value))
+            setattr(user, "hashed_password", await get_password_hash_async(value))
         elif value is not None:
             setattr(user, field, value)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate_user(user.id)
     return user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """
     Delete user (admin only)
@@ -103,4 +248,5 @@ def delete_user(
     
     db.delete(user)
     db.commit()
+    principal_cache.invalidate_user(user_id)
     return None
@@ -67,9 +67,32 @@ class VoteCreate(VoteBase):
 class TeamMemberCreate(TeamMemberBase):
     pass
 
+# 通知はワーカー間のバスでそのまま運ぶので、入力される本文の長さに上限を設ける
+NOTIFICATION_TITLE_MAX_LENGTH = 200
+NOTIFICATION_MESSAGE_MAX_LENGTH = 4000
+
 class NotificationCreate(NotificationBase):
+    title: str = Field(max_length=NOTIFICATION_TITLE_MAX_LENGTH)
+    message: str = Field(max_length=NOTIFICATION_MESSAGE_MAX_LENGTH)
     user_id: int
 
+# 一斉通知の宛先
+class NotificationAudience(str, Enum):
+    ALL = "all"                  # 有効な全ユーザー
+    DEPARTMENT = "department"    # department が一致するユーザー
+    PLAN_VOTERS = "plan_voters"  # business_plan_id に投票したユーザー
+    POC_TEAM = "poc_team"        # poc_plan_id のチームメンバー
+
+class BulkNotificationCreate(BaseModel):
+    title: str = Field(max_length=NOTIFICATION_TITLE_MAX_LENGTH)
+    message: str = Field(max_length=NOTIFICATION_MESSAGE_MAX_LENGTH)
+    notification_type: str = "announcement"
+    related_id: Optional[int] = None
+    audience: NotificationAudience
+    department: Optional[str] = None
+    business_plan_id: Optional[int] = None
+    poc_plan_id: Optional[int] = None
+
 # Update schemas
 class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
@@ -106,6 +129,9 @@ class PoCPlanUpdate(BaseModel):
 class NotificationUpdate(BaseModel):
     is_read: Optional[bool] = None
 
+class NotificationBulkRead(BaseModel):
+    ids: List[int] = Field(..., max_length=1000)
+
 # Response schemas
 class UserResponse(UserBase):
     id: int
@@ -124,10 +150,15 @@ class BusinessPlanResponse(BusinessPlanBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     vote_count: Optional[int] = None
+    # 一覧で include_voted_by_me=true のときだけ値が入る
+    voted_by_me: Optional[bool] = None
 
     class Config:
         from_attributes = True
 
+class VotedPlansResponse(BaseModel):
+    business_plan_ids: List[int]
+
 class PoCPlanResponse(PoCPlanBase):
     id: int
     creator_id: int
@@ -164,10 +195,17 @@ class NotificationResponse(NotificationBase):
     class Config:
         from_attributes = True
 
+class NotificationBulkUpdateResponse(BaseModel):
+    updated: int
+
+class BulkNotificationResponse(BaseModel):
+    audience: NotificationAudience
+    recipients: int
+
 # Detailed response schemas with relationships
 class BusinessPlanDetailResponse(BusinessPlanResponse):
+    # 投票は件数（vote_count）のみ。一覧は GET /business_plans/{id}/votes
     creator: UserResponse
-    votes: List[VoteResponse] = []
     poc_plans: List[PoCPlanResponse] = []
 
     class Config:
@@ -181,12 +219,14 @@ class PoCPlanDetailResponse(PoCPlanResponse):
     class Config:
         from_attributes = True
 
-class UserDetailResponse(UserResponse):
-    business_plans: List[BusinessPlanResponse] = []
-    poc_plans: List[PoCPlanResponse] = []
-    votes: List[VoteResponse] = []
-    team_memberships: List[TeamMemberResponse] = []
-    notifications: List[NotificationResponse] = []
+class UserSummaryResponse(UserResponse):
+    # 履歴は件数のみ。一覧は GET /users/{id}/business_plans などのサブリソースで取得する
+    business_plan_count: int = 0
+    poc_plan_count: int = 0
+    vote_count: int = 0
+    team_membership_count: int = 0
+    notification_count: int = 0
+    unread_notification_count: int = 0
 
     class Config:
         from_attributes = True
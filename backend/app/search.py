@@ -0,0 +1,257 @@
+# app/search.py
+"""
+ビジネスプラン / PoC プランの全文検索
+
+PostgreSQL では生成列 search_vector (tsvector) の GIN インデックスと、
+日本語の部分一致用に pg_trgm の GIN インデックスを使う。
+それ以外のバックエンド（開発用 SQLite など）ではプロセス内の転置インデックスで
+同じフィールドを対象にランク付き検索を行う。転置インデックスはワーカーごとにあるので、
+プランの作成・更新・削除は pub/sub バスで他のワーカーに知らせ、受け取ったワーカーは
+次の検索の前に該当プランを読み直す。
+"""
+import math
+import re
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import DDL, String, case, event, false, func, literal, literal_column, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.models import BusinessPlan, PoCPlan
+from app.pubsub import PubSubBus, bus as default_bus
+
+# ASCII の単語、またはそれ以外（日本語など）の文字の連続
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[^\W\x00-\x7f]+")
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    Split text into search tokens: ASCII words as-is, other scripts as
+    character bigrams so that Japanese substrings can be matched.
+    Documents are indexed with ``unigrams=True`` so one-character queries hit too.
+    """
+    tokens = []
+    for chunk in _TOKEN_RE.findall((text or "").lower()):
+        if chunk.isascii() or len(chunk) == 1:
+            tokens.append(chunk)
+            continue
+        tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        if unigrams:
+            tokens.extend(chunk)
+    return tokens
+
+
+class InvertedIndex:
+    """
+    In-process inverted index with TF-IDF ranking (fallback for non-Postgres)
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._documents: Dict[int, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id: int, weighted_fields: Sequence[Tuple[str, float]]):
+        terms: Dict[str, float] = {}
+        for text, weight in weighted_fields:
+            for token in tokenize(text, unigrams=True):
+                terms[token] = terms.get(token, 0.0) + weight
+        with self._lock:
+            self._remove(doc_id)
+            self._documents[doc_id] = terms
+            for token, weight in terms.items():
+                self._postings.setdefault(token, {})[doc_id] = weight
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        for token in self._documents.pop(doc_id, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """Return (doc_id, score) for documents containing every query token, best first"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        with self._lock:
+            postings = [self._postings.get(token, {}) for token in tokens]
+            if not all(postings):
+                return []
+            total = len(self._documents)
+            candidates = set.intersection(*(set(p) for p in postings))
+            scores = {
+                doc_id: sum(
+                    (1 + math.log(p[doc_id])) * math.log(1 + total / len(p))
+                    for p in postings
+                )
+                for doc_id in candidates
+            }
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+class PlanSearch:
+    """
+    Full-text search over one plan model
+    """
+
+    def __init__(self, model, weighted_fields: Sequence[Tuple[str, str]], bus: Optional[PubSubBus] = None):
+        # weighted_fields: (カラム名, tsvector の重み 'A'〜'D')
+        self.model = model
+        self.table = model.__tablename__
+        self.weighted_fields = weighted_fields
+        self.index = InvertedIndex()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        # 他のワーカーで変更され、次の検索の前に読み直すプラン ID
+        self._stale: Set[int] = set()
+        self._stale_lock = threading.Lock()
+        self._origin = uuid.uuid4().hex
+        self.bus = bus or default_bus
+        self.bus.subscribe("search_invalidate", self._on_invalidate)
+
+    # --- PostgreSQL -------------------------------------------------------
+    @property
+    def document_sql(self) -> str:
+        # pg_trgm インデックスと検索条件で完全に同じ式を使う
+        return " || ' ' || ".join(
+            f"coalesce({self.table}.{column}, '')" for column, _ in self.weighted_fields
+        )
+
+    @property
+    def vector_sql(self) -> str:
+        return " || ".join(
+            f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+            for column, weight in self.weighted_fields
+        )
+
+    def ddl(self) -> List[str]:
+        """Statements adding the generated tsvector column and its indexes"""
+        return [
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({self.vector_sql}) STORED",
+            f"CREATE INDEX IF NOT EXISTS ix_{self.table}_search_vector "
+            f"ON {self.table} USING GIN (search_vector)",
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE INDEX IF NOT EXISTS ix_{self.table}_search_trgm "
+            f"ON {self.table} USING GIN (({self.document_sql}) gin_trgm_ops)",
+        ]
+
+    # --- フォールバック用転置インデックス ----------------------------------
+    def _fields(self, plan) -> List[Tuple[str, float]]:
+        weights = {"A": 3.0, "B": 2.0, "C": 1.0, "D": 0.5}
+        return [(getattr(plan, column), weights[weight]) for column, weight in self.weighted_fields]
+
+    def _ensure_loaded(self, db: Session):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            # ロード中に届いた変更の印は残す（読み終えた後にもう一度読み直す）
+            with self._stale_lock:
+                self._stale.clear()
+            for row in db.query(self.model.id, *self._columns()).all():
+                self.index.add(row.id, self._fields(row))
+            self._loaded = True
+
+    def _columns(self):
+        return [getattr(self.model, column) for column, _ in self.weighted_fields]
+
+    def _reload_stale(self, db: Session):
+        with self._stale_lock:
+            ids, self._stale = self._stale, set()
+        if not ids:
+            return
+        found = set()
+        for row in db.query(self.model.id, *self._columns()).filter(self.model.id.in_(ids)).all():
+            self.index.add(row.id, self._fields(row))
+            found.add(row.id)
+        for plan_id in ids - found:
+            self.index.remove(plan_id)
+
+    def refresh(self, plan):
+        """Re-index a created or updated plan here and mark it stale on the other workers (call after commit)"""
+        if self._loaded:
+            self.index.add(plan.id, self._fields(plan))
+        self._publish([plan.id])
+
+    def discard(self, plan_id: int):
+        self.index.remove(plan_id)
+        self._publish([plan_id])
+
+    def _publish(self, plan_ids: Iterable[int]):
+        self.bus.publish_threadsafe({
+            "kind": "search_invalidate", "origin": self._origin, "table": self.table, "ids": list(plan_ids),
+        })
+
+    def _on_invalidate(self, event: dict):
+        if event.get("table") != self.table or event.get("origin") == self._origin:
+            return
+        # 未ロードなら初回ロードで最新を読むので印は不要（PostgreSQL では常に未ロード）
+        if self._loaded or self._load_lock.locked():
+            with self._stale_lock:
+                self._stale.update(event.get("ids", ()))
+
+    # --- 検索 ---------------------------------------------------------------
+    async def apply(self, query, db: AsyncSession, term: str):
+        """
+        Filter the select ``query`` to plans matching ``term`` and order them by relevance
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            vector = literal_column(f"{self.table}.search_vector")
+            tsquery = func.websearch_to_tsquery("simple", term)
+            # % と _ はワイルドカードではなく文字として探す
+            escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return query.filter(
+                or_(
+                    vector.op("@@")(tsquery),
+                    literal_column(f"({self.document_sql})").ilike(literal(f"%{escaped}%", String), escape="\\"),
+                )
+            ).order_by(func.ts_rank(vector, tsquery).desc(), self.model.id.desc())
+
+        if not self._loaded:
+            await db.run_sync(self._ensure_loaded)
+        elif self._stale:
+            await db.run_sync(self._reload_stale)
+        ranked = self.index.search(term)
+        if not ranked:
+            return query.filter(false())
+        positions = {doc_id: position for position, (doc_id, _) in enumerate(ranked)}
+        return query.filter(self.model.id.in_(positions)).order_by(
+            case(positions, value=self.model.id)
+        )
+
+
+business_plan_search = PlanSearch(BusinessPlan, [
+    ("title", "A"),
+    ("description", "B"),
+    ("problem_statement", "C"),
+    ("solution", "C"),
+])
+
+poc_plan_search = PlanSearch(PoCPlan, [
+    ("title", "A"),
+    ("description", "B"),
+    ("technical_requirements", "C"),
+    ("implementation_details", "C"),
+])
+
+# 既存のデータベースには v0005 の移行で追加する。create_all で作成したときもここで用意する
+for _search in (business_plan_search, poc_plan_search):
+    for _statement in _search.ddl():
+        event.listen(
+            _search.model.__table__,
+            "after_create",
+            DDL(_statement).execute_if(dialect="postgresql"),
+        )
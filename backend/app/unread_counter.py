@@ -0,0 +1,143 @@
+# app/unread_counter.py
+"""
+User.unread_notification_count（非正規化未読数カウンタ）の更新・配信・整合性回復
+
+ORM で通知を追加・既読化・削除したときはセッションイベントで同じトランザクション内に
+カウンタを更新する。Core の一括 INSERT / UPDATE / DELETE を使う箇所は
+adjust_unread_count() を明示的に呼ぶ（絶対値で上書きすると同時に追加された通知の分がずれるため、
+常に増減で更新する）。
+カウンタを更新するたびに User.notifications_version（通知一覧の ETag の元）も 1 増やす。
+未読数が変わらない変更（既読通知の削除など）は bump_notifications_version() で版だけを上げる。
+コミット後、値が変わったユーザーの WebSocket へ {"type": "unread_count", "count": n} を送る。
+"""
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import Notification, User
+from app.pubsub import bus
+
+_CHANGED_KEY = "unread_counts_changed"
+
+
+def counted_unread():
+    """
+    Correlated scalar subquery counting the unread notifications of the outer User row
+    """
+    return (
+        select(func.count(Notification.id))
+        .where(Notification.user_id == User.id, Notification.is_read == False)
+        .correlate(User)
+        .scalar_subquery()
+    )
+
+
+def record_unread_count(db: Session, user_id: int, count: int):
+    """Push ``count`` to the user after ``db`` commits (for counters updated in raw SQL)"""
+    db.info.setdefault(_CHANGED_KEY, {})[user_id] = count
+
+
+def notifications_version_bump(user_ids: Iterable[int]):
+    """UPDATE statement bumping the notifications version of ``user_ids`` (for sync and async sessions)"""
+    return (
+        update(User)
+        .where(User.id.in_(sorted(set(user_ids))))
+        .values(notifications_version=User.notifications_version + 1, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_notifications_version(db: Session, user_ids: Iterable[int]):
+    """Invalidate the notification list ETags of ``user_ids`` in the caller's transaction"""
+    user_ids = set(user_ids)
+    if user_ids:
+        db.connection().execute(notifications_version_bump(user_ids))
+
+
+def adjust_unread_count(db: Session, user_id: int, delta: int) -> int:
+    """
+    Atomically add ``delta`` to a user's unread counter in the caller's
+    transaction and return the new value (pushed to the user after commit)
+    """
+    count = db.connection().execute(
+        update(User)
+        .where(User.id == user_id)
+        # updated_at はプロフィール更新日時なので据え置く
+        .values(unread_notification_count=User.unread_notification_count + delta,
+                notifications_version=User.notifications_version + 1,
+                updated_at=User.updated_at)
+        .returning(User.unread_notification_count)
+    ).scalar_one_or_none()
+    if count is not None:
+        record_unread_count(db, user_id, count)
+    return count
+
+
+def publish_unread_count(user_id: int, count: int):
+    bus.publish_threadsafe({
+        "kind": "user",
+        "user_id": user_id,
+        "message": '{"type": "unread_count", "count": %d}' % count,
+    })
+
+
+def reconcile_unread_counts(db: Session) -> int:
+    """
+    Recompute every drifted counter from the notifications table and return
+    the number of corrected users
+    """
+    actual = counted_unread()
+    result = db.execute(
+        update(User)
+        .where(User.unread_notification_count != actual)
+        .values(unread_notification_count=actual, updated_at=User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+@event.listens_for(Session, "after_flush")
+def _track_unread_changes(session, flush_context):
+    deltas: Dict[int, int] = defaultdict(int)
+    touched = set()
+    for obj in session.new:
+        if isinstance(obj, Notification):
+            touched.add(obj.user_id)
+            if not obj.is_read:
+                deltas[obj.user_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Notification):
+            touched.add(obj.user_id)
+            history = inspect(obj).attrs.is_read.history
+            was_read = history.deleted[0] if history.deleted else obj.is_read
+            if not was_read:
+                deltas[obj.user_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Notification) and session.is_modified(obj):
+            touched.add(obj.user_id)
+            history = inspect(obj).attrs.is_read.history
+            if not history.added:
+                continue
+            was_read = bool(history.deleted[0]) if history.deleted else False
+            if was_read != bool(history.added[0]):
+                deltas[obj.user_id] += -1 if history.added[0] else 1
+    for user_id, delta in deltas.items():
+        if delta and user_id is not None:
+            adjust_unread_count(session, user_id, delta)
+            touched.discard(user_id)
+    touched.discard(None)
+    bump_notifications_version(session, touched)
+
+
+@event.listens_for(Session, "after_commit")
+def _push_unread_counts(session):
+    for user_id, count in session.info.pop(_CHANGED_KEY, {}).items():
+        publish_unread_count(user_id, count)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_unread_counts(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,148 @@
+# app/vote_broadcast.py
+"""
+vote_update の間引き（コアレッシング）配信
+
+投票・取り消しのたびに配信すると、同じプランへの連続投票が購読者数 × 投票数のフレームになる。
+VOTE_UPDATE_WINDOW_MS の間に届いた更新をプランごとに最新値へまとめ、接続ごとに
+1 フレーム（type: "vote_updates"）で送る。
+まとめた更新はバスで全ワーカーに流し、各ワーカーが自分の購読者へ配信する。
+
+投票ごとのバックグラウンドタスクはコミット順に走るとは限らないため、受け取った件数は
+最新とは限らない。ウィンドウを閉じるときに対象プランの vote_count を読み直し、その値を送る。
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app import metrics
+from app.database import AsyncSessionLocal
+from app.models.models import BusinessPlan
+from app.pubsub import PubSubBus
+from app.websocket_manager import ConnectionManager, manager, plan_topic, PLANS_LIST_TOPIC
+
+logger = logging.getLogger(__name__)
+
+VOTE_UPDATE_WINDOW_MS = float(os.getenv("VOTE_UPDATE_WINDOW_MS", "150"))
+
+CountLoader = Callable[[Iterable[int]], Awaitable[Dict[int, int]]]
+
+
+async def load_vote_counts(business_plan_ids: Iterable[int]) -> Dict[int, int]:
+    """Committed vote_count of each plan (deleted plans are omitted)"""
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(BusinessPlan.id, BusinessPlan.vote_count).where(BusinessPlan.id.in_(list(business_plan_ids)))
+        )
+        return dict(rows.all())
+
+
+class VoteUpdatePublisher:
+    """
+    Collects vote counts per plan over a short window and publishes the final values
+    """
+
+    def __init__(self, connections: ConnectionManager, window_ms: float = VOTE_UPDATE_WINDOW_MS,
+                 bus: Optional[PubSubBus] = None, load_counts: Optional[CountLoader] = load_vote_counts):
+        self.connections = connections
+        # None なら読み直さず、ウィンドウ内で最後に受け取った件数を送る
+        self.load_counts = load_counts
+        self.bus = bus or connections.bus
+        self.bus.subscribe("vote_updates", self._on_vote_updates)
+        self.window = window_ms / 1000
+        # {business_plan_id: (最新の vote_count, ウィンドウ内の更新回数)}
+        self._pending: Dict[int, Tuple[int, int]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._reloads: Set[asyncio.Task] = set()
+        self._reload_lock = asyncio.Lock()
+        self.updates = 0
+        self.flushes = 0
+        self.reload_errors = 0
+        self.frames_sent = 0
+        # 間引かずに 1 更新 1 フレームで送っていた場合のフレーム数
+        self.frames_uncoalesced = 0
+
+    def publish(self, business_plan_id: int, vote_count: int):
+        """Record the latest count of a plan; must be called on the event loop"""
+        _, seen = self._pending.get(business_plan_id, (vote_count, 0))
+        self._pending[business_plan_id] = (vote_count, seen + 1)
+        self.updates += 1
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        self.flushes += 1
+        if self.load_counts is None:
+            self._publish(pending)
+            return
+        task = asyncio.get_running_loop().create_task(self._publish_latest(pending))
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _publish_latest(self, pending: Dict[int, Tuple[int, int]]):
+        # 前のウィンドウの読み直しより先に送ると古い値で上書きしうるので、ウィンドウ順に直列化する
+        async with self._reload_lock:
+            try:
+                latest = await self.load_counts(sorted(pending))
+            except Exception as e:
+                # 読めなければ受け取った件数で送る（次の投票で正しい値に戻る）
+                self.reload_errors += 1
+                logger.warning(f"Could not reload vote counts; sending the received ones: {e}")
+                latest = {}
+            for plan_id, count in latest.items():
+                if plan_id in pending:
+                    pending[plan_id] = (count, pending[plan_id][1])
+            self._publish(pending)
+
+    def _publish(self, pending: Dict[int, Tuple[int, int]]):
+        # [business_plan_id, vote_count, ウィンドウ内の更新回数]
+        self.bus.publish({
+            "kind": "vote_updates",
+            "updates": [[plan_id, count, seen] for plan_id, (count, seen) in sorted(pending.items())],
+        })
+
+    def _on_vote_updates(self, event: dict):
+        self._deliver(event["updates"])
+
+    def _deliver(self, updates: List[list]):
+        list_subscribers = self.connections.subscribers([PLANS_LIST_TOPIC])
+        per_connection: Dict[object, list] = {}
+        for business_plan_id, vote_count, seen in updates:
+            recipients = list_subscribers | self.connections.subscribers([plan_topic(business_plan_id)])
+            self.frames_uncoalesced += seen * len(recipients)
+            update = {"business_plan_id": business_plan_id, "vote_count": vote_count}
+            for connection in recipients:
+                per_connection.setdefault(connection, []).append(update)
+
+        # 一覧購読者は同じ内容になることが多いので、同一内容の JSON は使い回す
+        encoded: Dict[Tuple[int, ...], str] = {}
+        for connection, updates in per_connection.items():
+            key = tuple(u["business_plan_id"] for u in updates)
+            message = encoded.get(key)
+            if message is None:
+                message = encoded[key] = json.dumps({"type": "vote_updates", "updates": updates})
+            connection.enqueue(message)
+            self.frames_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "pending_plans": len(self._pending),
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "reload_errors": self.reload_errors,
+            "frames_sent": self.frames_sent,
+            "frames_uncoalesced": self.frames_uncoalesced,
+            "frames_saved": self.frames_uncoalesced - self.frames_sent,
+        }
+
+
+vote_update_publisher = VoteUpdatePublisher(manager)
+metrics.register("vote_updates", vote_update_publisher.stats)
@@ -0,0 +1,52 @@
+# app/vote_counter.py
+"""
+BusinessPlan.vote_count（非正規化投票数カウンタ）の更新と整合性回復
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import BusinessPlan, Vote
+
+
+def counted_votes():
+    """
+    Correlated scalar subquery counting the votes of the outer BusinessPlan row
+    """
+    return (
+        select(func.count(Vote.id))
+        .where(Vote.business_plan_id == BusinessPlan.id)
+        .correlate(BusinessPlan)
+        .scalar_subquery()
+    )
+
+
+def adjust_vote_count(db: Session, business_plan_id: int, delta: int) -> int:
+    """
+    Atomically add ``delta`` to a plan's vote counter and return the new value.
+
+    The UPDATE runs in the caller's transaction, so the counter is committed
+    together with the vote row it accounts for.
+    """
+    return db.execute(
+        update(BusinessPlan)
+        .where(BusinessPlan.id == business_plan_id)
+        .values(vote_count=BusinessPlan.vote_count + delta)
+        .returning(BusinessPlan.vote_count)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+
+def reconcile_vote_counts(db: Session) -> int:
+    """
+    Recompute every drifted counter from the votes table and return the number
+    of corrected plans
+    """
+    actual = counted_votes()
+    result = db.execute(
+        update(BusinessPlan)
+        .where(BusinessPlan.vote_count != actual)
+        .values(vote_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
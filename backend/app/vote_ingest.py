@@ -0,0 +1,239 @@
+# app/vote_ingest.py
+"""
+投票のグループコミット取り込み
+
+VOTE_INGEST_MODE=batched のとき、検証済みの投票をプロセス内キューに積み、
+数ミリ秒ごとに 1 トランザクションでまとめて書き込む。
+呼び出し元はそれぞれ自分の投票が受理されたか（重複だったか）を受け取る。
+バッチが失敗した場合は 1 票ずつ書き直し、失敗の原因になった票の呼び出し元だけにエラーを返す。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert as sa_insert, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.models import BusinessPlan, Notification, Vote
+from app.notification_outbox import mark_outbox_pending
+from app.unread_counter import adjust_unread_count
+from app.vote_counter import adjust_vote_count
+
+logger = logging.getLogger(__name__)
+
+VOTE_INGEST_MODE = os.getenv("VOTE_INGEST_MODE", "direct")
+VOTE_INGEST_FLUSH_MS = float(os.getenv("VOTE_INGEST_FLUSH_MS", "5"))
+VOTE_INGEST_MAX_BATCH = int(os.getenv("VOTE_INGEST_MAX_BATCH", "500"))
+VOTE_INGEST_TIMEOUT_SECONDS = float(os.getenv("VOTE_INGEST_TIMEOUT_SECONDS", "10"))
+
+
+@dataclass
+class PendingVote:
+    user_id: int
+    user_full_name: str
+    business_plan_id: int
+    plan_title: str
+    plan_creator_id: int
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class VoteIngestResult:
+    # 受理された場合は投票行（id, user_id, business_plan_id, created_at）、重複なら None
+    vote: Optional[dict]
+    vote_count: Optional[int] = None
+    # 検証後、書き込みまでの間にプランが削除されていた
+    plan_missing: bool = False
+
+
+def insert_votes_ignoring_duplicates(db: Session, rows: List[dict]):
+    """
+    Multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING for the votes table
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Batched vote ingestion is not supported on {dialect}")
+
+    stmt = (
+        insert(Vote)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["user_id", "business_plan_id"])
+        .returning(Vote.id, Vote.user_id, Vote.business_plan_id, Vote.created_at)
+    )
+    return db.execute(stmt).all()
+
+
+def write_vote_batch(db: Session, batch: List[PendingVote]) -> List[VoteIngestResult]:
+    """
+    Write a batch of votes, their counter updates and notifications in the
+    caller's transaction and return one result per pending vote
+    """
+    # 受付後に削除されたプランへの票は外す（FK 違反でバッチ全体が失敗しないように）。
+    # FOR KEY SHARE でコミットまでプランの削除を止める（SQLite では無視される）
+    plan_ids = sorted({pending.business_plan_id for pending in batch})
+    existing = set(db.scalars(
+        select(BusinessPlan.id)
+        .where(BusinessPlan.id.in_(plan_ids))
+        .with_for_update(read=True, key_share=True)
+    ))
+
+    # 同一バッチ内の二重投票は先頭だけを INSERT 対象にする
+    unique: Dict[Tuple[int, int], PendingVote] = {}
+    for pending in batch:
+        if pending.business_plan_id in existing:
+            unique.setdefault((pending.user_id, pending.business_plan_id), pending)
+
+    inserted = insert_votes_ignoring_duplicates(db, [
+        {"user_id": user_id, "business_plan_id": plan_id}
+        for user_id, plan_id in unique
+    ]) if unique else []
+    accepted = {(row.user_id, row.business_plan_id): row for row in inserted}
+
+    per_plan: Dict[int, int] = {}
+    for user_id, plan_id in accepted:
+        per_plan[plan_id] = per_plan.get(plan_id, 0) + 1
+    vote_counts = {
+        plan_id: adjust_vote_count(db, plan_id, delta)
+        for plan_id, delta in sorted(per_plan.items())
+    }
+
+    notifications = [
+        {
+            "user_id": pending.plan_creator_id,
+            "title": "New Vote",
+            "message": f"{pending.user_full_name} voted for your business plan: {pending.plan_title}",
+            "notification_type": "vote",
+            "related_id": pending.business_plan_id,
+            "is_read": False,
+        }
+        for key, pending in unique.items()
+        if key in accepted
+    ]
+    if notifications:
+        db.execute(sa_insert(Notification), notifications)
+        # Core の一括 INSERT はセッションイベントで検知できないので明示的に知らせる
+        mark_outbox_pending(db)
+        unread: Dict[int, int] = {}
+        for row in notifications:
+            unread[row["user_id"]] = unread.get(row["user_id"], 0) + 1
+        for user_id, delta in sorted(unread.items()):
+            adjust_unread_count(db, user_id, delta)
+
+    results = []
+    for pending in batch:
+        key = (pending.user_id, pending.business_plan_id)
+        row = accepted.get(key)
+        if pending.business_plan_id not in existing:
+            results.append(VoteIngestResult(vote=None, plan_missing=True))
+        elif row is None or unique[key] is not pending:
+            results.append(VoteIngestResult(vote=None))
+        else:
+            results.append(VoteIngestResult(
+                vote=dict(row._mapping),
+                vote_count=vote_counts[pending.business_plan_id],
+            ))
+    return results
+
+
+class VoteIngestor:
+    """
+    Collects votes from request threads and writes them with one commit per
+    flush interval
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_interval_ms: float = VOTE_INGEST_FLUSH_MS,
+                 max_batch: int = VOTE_INGEST_MAX_BATCH):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[PendingVote]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return VOTE_INGEST_MODE == "batched"
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="vote-ingestor", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Flush the queued votes and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, pending: PendingVote) -> Future:
+        """Queue a validated vote; the future resolves to a VoteIngestResult"""
+        if self._thread is None:
+            self.start()
+        self._queue.put(pending)
+        return pending.future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[PendingVote]):
+        try:
+            results = self._write(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Vote by user {batch[0].user_id} failed: {e}")
+                batch[0].future.set_exception(e)
+                return
+            # 1 票の失敗でバッチ全員をエラーにしないよう、1 票ずつ書き直す
+            logger.warning(f"Vote batch of {len(batch)} failed, retrying one by one: {e}")
+            for pending in batch:
+                self._flush([pending])
+            return
+        for pending, result in zip(batch, results):
+            pending.future.set_result(result)
+
+    def _write(self, batch: List[PendingVote]) -> List[VoteIngestResult]:
+        db = self.session_factory()
+        try:
+            results = write_vote_batch(db, batch)
+            db.commit()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+vote_ingestor = VoteIngestor()
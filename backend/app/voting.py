@@ -0,0 +1,140 @@
+# app/voting.py
+"""
+投票・投票取消の書き込み
+
+PostgreSQL では投票を 1 文（データ変更 CTE）で行う: プランの確認、
+INSERT ... ON CONFLICT DO NOTHING、投票数カウンタの加算、作成者への通知と未読数の加算を
+まとめて実行し、更新後の投票数を返す。取消も DELETE ... RETURNING とカウンタの減算を 1 文で行う。
+同じユーザーの同時リクエストは (user_id, business_plan_id) の一意制約で 1 件だけが成立する。
+SQLite（開発用）は CTE 内の INSERT/UPDATE/DELETE に対応しないため、同じ処理を数文に分けて行う。
+"""
+from typing import Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from app.models.models import BusinessPlan, Notification, Vote
+from app.notification_outbox import mark_outbox_pending
+from app.unread_counter import record_unread_count
+from app.vote_counter import adjust_vote_count
+from app.vote_ingest import VoteIngestResult, insert_votes_ignoring_duplicates
+
+_CAST_VOTE_SQL = text("""
+WITH plan AS (
+    SELECT id, title, creator_id, vote_count FROM business_plans WHERE id = :business_plan_id
+),
+inserted AS (
+    INSERT INTO votes (user_id, business_plan_id)
+    SELECT :user_id, plan.id FROM plan
+    ON CONFLICT (user_id, business_plan_id) DO NOTHING
+    RETURNING id, user_id, business_plan_id, created_at
+),
+counter AS (
+    UPDATE business_plans SET vote_count = vote_count + 1
+    WHERE id IN (SELECT business_plan_id FROM inserted)
+    RETURNING vote_count
+),
+notification AS (
+    INSERT INTO notifications (user_id, title, message, notification_type, related_id, is_read, delivery_status)
+    SELECT plan.creator_id, 'New Vote',
+           CAST(:voter_name AS TEXT) || ' voted for your business plan: ' || COALESCE(plan.title, ''),
+           'vote', plan.id, FALSE, 'pending'
+    FROM plan JOIN inserted ON TRUE
+    RETURNING user_id
+),
+unread AS (
+    UPDATE users SET unread_notification_count = unread_notification_count + 1,
+                     notifications_version = notifications_version + 1
+    WHERE id IN (SELECT user_id FROM notification)
+    RETURNING id, unread_notification_count
+)
+SELECT inserted.id, inserted.user_id, inserted.business_plan_id, inserted.created_at,
+       COALESCE((SELECT vote_count FROM counter), plan.vote_count) AS vote_count,
+       (SELECT id FROM unread) AS notified_user_id,
+       (SELECT unread_notification_count FROM unread) AS unread_count
+FROM plan LEFT JOIN inserted ON TRUE
+""")
+
+_RETRACT_VOTE_SQL = text("""
+WITH removed AS (
+    DELETE FROM votes WHERE user_id = :user_id AND business_plan_id = :business_plan_id
+    RETURNING id, business_plan_id
+),
+counter AS (
+    UPDATE business_plans SET vote_count = vote_count - 1
+    WHERE id IN (SELECT business_plan_id FROM removed)
+    RETURNING vote_count
+)
+SELECT (SELECT id FROM removed) AS vote_id,
+       COALESCE((SELECT vote_count FROM counter), plan.vote_count) AS vote_count
+FROM business_plans plan WHERE plan.id = :business_plan_id
+""")
+
+
+def cast_vote(db: Session, user_id: int, voter_name: str, business_plan_id: int) -> Optional[VoteIngestResult]:
+    """
+    Record a vote, bump the counter and notify the plan's creator in the caller's transaction.
+    Returns None when the plan does not exist; ``vote`` is None when the user had already voted.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        row = db.execute(_CAST_VOTE_SQL, {
+            "user_id": user_id, "business_plan_id": business_plan_id, "voter_name": voter_name,
+        }).one_or_none()
+        if row is None:
+            return None
+        if row.id is None:
+            return VoteIngestResult(vote=None, vote_count=row.vote_count)
+        mark_outbox_pending(db)
+        if row.notified_user_id is not None:
+            record_unread_count(db, row.notified_user_id, row.unread_count)
+        vote = {"id": row.id, "user_id": row.user_id, "business_plan_id": row.business_plan_id,
+                "created_at": row.created_at}
+        return VoteIngestResult(vote=vote, vote_count=row.vote_count)
+
+    plan = db.execute(
+        select(BusinessPlan.title, BusinessPlan.creator_id, BusinessPlan.vote_count)
+        .where(BusinessPlan.id == business_plan_id)
+    ).one_or_none()
+    if plan is None:
+        return None
+    inserted = insert_votes_ignoring_duplicates(db, [{"user_id": user_id, "business_plan_id": business_plan_id}])
+    if not inserted:
+        return VoteIngestResult(vote=None, vote_count=plan.vote_count)
+    vote_count = adjust_vote_count(db, business_plan_id, 1)
+    # ORM で追加するとアウトボックスと未読数はセッションイベントが処理する
+    db.add(Notification(
+        user_id=plan.creator_id,
+        title="New Vote",
+        message=f"{voter_name} voted for your business plan: {plan.title}",
+        notification_type="vote",
+        related_id=business_plan_id,
+    ))
+    return VoteIngestResult(vote=dict(inserted[0]._mapping), vote_count=vote_count)
+
+
+def retract_vote(db: Session, user_id: int, business_plan_id: int) -> Optional[VoteIngestResult]:
+    """
+    Delete the user's vote and decrement the counter in the caller's transaction.
+    Returns None when the plan does not exist; ``vote`` is None when there was no vote.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        row = db.execute(_RETRACT_VOTE_SQL, {
+            "user_id": user_id, "business_plan_id": business_plan_id,
+        }).one_or_none()
+        if row is None:
+            return None
+        vote = {"id": row.vote_id} if row.vote_id is not None else None
+        return VoteIngestResult(vote=vote, vote_count=row.vote_count)
+
+    removed = db.execute(
+        delete(Vote)
+        .where(Vote.user_id == user_id, Vote.business_plan_id == business_plan_id)
+        .returning(Vote.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if removed is not None:
+        return VoteIngestResult(vote={"id": removed.id}, vote_count=adjust_vote_count(db, business_plan_id, -1))
+    vote_count = db.scalar(select(BusinessPlan.vote_count).where(BusinessPlan.id == business_plan_id))
+    if vote_count is None:
+        return None
+    return VoteIngestResult(vote=None, vote_count=vote_count)
@@ -1,67 +1,271 @@
 # app/websocket_manager.py
+"""
+WebSocket 接続管理
+
+各接続は上限付きの送信キューと専用の送信タスクを持つ。broadcast / send_notification_to_user は
+キューに積むだけで待たないため、遅いクライアントが他のクライアントへの配信を止めることはない。
+キューが溢れたときの扱いは WS_BACKPRESSURE_POLICY で選ぶ:
+  drop_oldest  最も古い未送信フレームを捨てる（既定）
+  disconnect   遅いクライアントを切断する（クライアントは再接続して最新状態を取り直す）
+
+クライアントは {"action": "subscribe" | "unsubscribe", "topics": [...]} を送ってトピックを購読する。
+publish() は topic → 接続 の索引を引くため、購読していない接続には一切触れない。
+  plan:{id}    個別プランの更新（詳細画面）
+  plans:list   全プランの更新（一覧画面）
+
+送信系メソッド（publish / send_notification_to_user / broadcast）は app.pubsub のバスに流し、
+各ワーカーが自分の保持する接続へ配信する（複数ワーカー構成でも全クライアントに届く）。
+"""
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Set
 from asyncio import Lock
+import asyncio
 import json
+import logging
+import os
+import re
+import time
+
+from app import metrics
+from app.pubsub import PubSubBus, bus as default_bus
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_BACKPRESSURE_POLICY = os.getenv("WS_BACKPRESSURE_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "200"))
+
+PLANS_LIST_TOPIC = "plans:list"
+_TOPIC_RE = re.compile(r"^(plan:[1-9][0-9]*|plans:list)$")
+
+
+def plan_topic(business_plan_id: int) -> str:
+    return f"plan:{business_plan_id}"
+
+# 1013 Try Again Later: 過負荷による切断
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """
+    One accepted WebSocket with its bounded outbound queue and writer task
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=manager.queue_size)
+        self.topics: Set[str] = set()
+        self.closed = False
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, message: str) -> bool:
+        """Queue ``message`` without waiting; applies the backpressure policy when full"""
+        if self.closed:
+            return False
+        if self.queue.full():
+            if self.manager.policy == "disconnect":
+                self.manager.frames_dropped += 1
+                self.manager.slow_consumer_disconnects += 1
+                logger.warning(f"User {self.user_id}'s WebSocket is too slow; disconnecting.")
+                self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self.queue.get_nowait()
+            self.manager.frames_dropped += 1
+        self.queue.put_nowait(message)
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if message is None:
+                    break
+                start = time.perf_counter()
+                await asyncio.wait_for(
+                    self.websocket.send_text(message), timeout=self.manager.send_timeout
+                )
+                self.manager.send_seconds.observe(time.perf_counter() - start)
+                self.manager.frames_sent += 1
+        except asyncio.TimeoutError:
+            self.manager.slow_consumer_disconnects += 1
+            logger.warning(f"Sending to user {self.user_id}'s WebSocket timed out; disconnecting.")
+            self.close(SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            logger.exception(f"Error sending to user {self.user_id}'s WebSocket")
+            self.close()
+
+    def close(self, code: Optional[int] = None):
+        """Stop the writer and unregister; with ``code`` also close the socket itself"""
+        if self.closed:
+            return
+        self.closed = True
+        self.manager._forget(self)
+        # 未送信分を捨てて送信タスクを止める
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.manager.frames_dropped += 1
+        self.queue.put_nowait(None)
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, policy: str = WS_BACKPRESSURE_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS, bus: Optional[PubSubBus] = None):
+        if policy not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Unknown WS_BACKPRESSURE_POLICY: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
         # キーをユーザーID (int) に変更
-        self.active_connections: Dict[int, List[WebSocket]] = {} # {user_id: [WebSocket, ...]}
+        self.active_connections: Dict[int, List[ClientConnection]] = {} # {user_id: [ClientConnection, ...]}
+        self.topics: Dict[str, Set[ClientConnection]] = {} # {topic: {ClientConnection, ...}}
         self.lock = Lock()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.slow_consumer_disconnects = 0
+        self.send_seconds = metrics.Histogram()
+        self.bus = bus or default_bus
+        self.bus.subscribe("topic", self._on_topic_message)
+        self.bus.subscribe("user", self._on_user_message)
+        self.bus.subscribe("broadcast", self._on_broadcast_message)
 
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
+        connection = ClientConnection(websocket, user_id, self)
         async with self.lock:
-            if user_id not in self.active_connections:
-                self.active_connections[user_id] = []
-            self.active_connections[user_id].append(websocket)
+            self.active_connections.setdefault(user_id, []).append(connection)
         print(f"User {user_id} connected via WebSocket.")
+        return connection
 
-    async def disconnect(self, websocket: WebSocket, user_id: int): # ★business_plan_id を user_id に変更し、async def に変更★
-        async with self.lock:
-            if user_id in self.active_connections:
-                if websocket in self.active_connections[user_id]:
-                    self.active_connections[user_id].remove(websocket)
-                if not self.active_connections[user_id]:
-                    del self.active_connections[user_id]
+    async def disconnect(self, websocket: WebSocket, user_id: int):
+        for connection in list(self.active_connections.get(user_id, ())):
+            if connection.websocket is websocket:
+                connection.close()
         print(f"User {user_id} disconnected from WebSocket.")
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        try:
-            await websocket.send_text(message)
-        except RuntimeError as e:
-            print(f"Error sending personal message to WebSocket: {e}")
+    def _forget(self, connection: ClientConnection):
+        # イベントループ上で同期的に呼ばれるので lock は不要（await を挟まない）
+        connections = self.active_connections.get(connection.user_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[connection.user_id]
+        for topic in list(connection.topics):
+            self._unsubscribe(connection, topic)
 
-    async def send_notification_to_user(self, target_user_id: int, message_payload: Dict):
-        connections_to_send: List[WebSocket] = []
-        async with self.lock:
-            if target_user_id in self.active_connections:
-                connections_to_send = list(self.active_connections[target_user_id]) # コピーを作成
+    # --- トピック購読 -----------------------------------------------------------
+    def subscribe(self, connection: ClientConnection, topics: Iterable[str]) -> List[str]:
+        topics = list(topics)
+        invalid = [t for t in topics if not isinstance(t, str) or not _TOPIC_RE.match(t)]
+        if invalid:
+            raise ValueError(f"Unknown topics: {invalid}")
+        if len(connection.topics | set(topics)) > WS_MAX_SUBSCRIPTIONS:
+            raise ValueError(f"Too many subscriptions (max {WS_MAX_SUBSCRIPTIONS})")
+        for topic in topics:
+            connection.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(connection)
+        return sorted(connection.topics)
+
+    def unsubscribe(self, connection: ClientConnection, topics: Iterable[str]) -> List[str]:
+        for topic in topics:
+            self._unsubscribe(connection, topic)
+        return sorted(connection.topics)
+
+    def _unsubscribe(self, connection: ClientConnection, topic: str):
+        connection.topics.discard(topic)
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
+
+    async def handle_client_message(self, connection: ClientConnection, data: str):
+        """Handle a subscribe/unsubscribe request sent by the client"""
+        try:
+            request = json.loads(data)
+            action = request.get("action")
+            topics = request.get("topics")
+            if topics is None and "topic" in request:
+                topics = [request["topic"]]
+            if action not in ("subscribe", "unsubscribe") or not isinstance(topics, list):
+                raise ValueError("Expected {\"action\": \"subscribe\" | \"unsubscribe\", \"topics\": [...]}")
+            if action == "subscribe":
+                current = self.subscribe(connection, topics)
             else:
-                print(f"User {target_user_id} is not currently online via WebSocket.")
-                return
-
-        json_message = json.dumps(message_payload)
-        for connection in connections_to_send:
-            try:
-                await connection.send_text(json_message)
-                print(f"Sent notification to user {target_user_id}'s WebSocket: {message_payload.get('title', 'No Title')}")
-            except RuntimeError as e:
-                print(f"Error sending notification to user {target_user_id}'s WebSocket: {e}")
-                pass
+                current = self.unsubscribe(connection, topics)
+            reply = {"type": "subscriptions", "topics": current}
+        except (ValueError, AttributeError) as e:
+            reply = {"type": "error", "detail": str(e)}
+        connection.enqueue(json.dumps(reply))
+
+    def subscribers(self, topics: Iterable[str]) -> Set[ClientConnection]:
+        recipients: Set[ClientConnection] = set()
+        for topic in topics:
+            recipients.update(self.topics.get(topic, ()))
+        return recipients
+
+    async def publish(self, topics: Iterable[str], message: str):
+        """Send ``message`` once to every connection (on any worker) subscribed to any of ``topics``"""
+        self.bus.publish({"kind": "topic", "topics": list(topics), "message": message})
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        for connections in self.active_connections.values():
+            for connection in connections:
+                if connection.websocket is websocket:
+                    connection.enqueue(message)
+                    return
+
+    async def send_notification_to_user(self, target_user_id: int, message_payload: Dict) -> bool:
+        """Publish to the user's connections on every worker; False if the bus did not take the message"""
+        return await self.bus.publish_confirmed(
+            {"kind": "user", "user_id": target_user_id, "message": json.dumps(message_payload)}
+        )
 
     async def broadcast(self, message: str):
-        connections_to_send: List[WebSocket] = []
-        async with self.lock:
-            for user_id_key in self.active_connections:
-                connections_to_send.extend(self.active_connections[user_id_key])
+        self.bus.publish({"kind": "broadcast", "message": message})
+
+    # --- バスから受け取ったメッセージをこのワーカーの接続へ配信 ---------------------
+    # 各接続のキューに積むだけなので、実際の送信は接続ごとの送信タスクで並行に行われる
+    def _on_topic_message(self, event: dict):
+        for connection in self.subscribers(event["topics"]):
+            connection.enqueue(event["message"])
+
+    def _on_user_message(self, event: dict):
+        for connection in list(self.active_connections.get(event["user_id"], ())):
+            connection.enqueue(event["message"])
+
+    def _on_broadcast_message(self, event: dict):
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.enqueue(event["message"])
+
+    def stats(self) -> dict:
+        depths = [c.queue.qsize() for cs in self.active_connections.values() for c in cs]
+        return {
+            "connections": len(depths),
+            "users": len(self.active_connections),
+            "topics": len(self.topics),
+            "subscriptions": sum(len(c) for c in self.topics.values()),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "send_seconds": self.send_seconds.snapshot(),
+        }
 
-        for connection in connections_to_send:
-            try:
-                await connection.send_text(message)
-            except RuntimeError as e:
-                print(f"Error sending broadcast message: {e}")
-                pass
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
+metrics.register("websocket", manager.stats)
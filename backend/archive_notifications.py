@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+# Add application path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.notification_retention import notification_sweeper
+
+async def run():
+    result = await notification_sweeper.run_once()
+    if result is None:
+        print("Another process is sweeping notifications right now; try again later")
+        return
+    created, archived = result
+    if created:
+        print(f"Created {created} notification partition(s)")
+    print(f"Archived {archived} read notification(s) older than {notification_sweeper.retention_days} days ({notification_sweeper.mode})")
+
+def main():
+    """Run one retention sweep now (the API server also runs it in the background)"""
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
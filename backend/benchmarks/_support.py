@@ -0,0 +1,99 @@
+"""
+ベンチマーク共通ユーティリティ
+
+インメモリ SQLite にスキーマを作成し、ダミーデータ投入と
+発行 SQL 数の計測を行う。
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# backend/ を import パスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.models import User, BusinessPlan, Vote
+from app.vote_counter import reconcile_vote_counts
+
+
+def make_session_factory(url: str = "sqlite://"):
+    """Create an engine with the full schema and return a session factory"""
+    if url == "sqlite://":
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+    else:
+        engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed(db, users: int = 50, plans: int = 200, votes_per_plan: int = 10):
+    """Insert users, business plans and votes"""
+    db.add_all([
+        User(
+            email=f"user{i}@example.com",
+            username=f"user{i}",
+            hashed_password="x",
+            full_name=f"User {i}",
+            department="dev",
+            role="user",
+        )
+        for i in range(users)
+    ])
+    db.flush()
+    user_ids = [u.id for u in db.query(User).all()]
+    db.add_all([
+        BusinessPlan(
+            title=f"Plan {i}",
+            description="description " * 20,
+            problem_statement="problem",
+            solution="solution",
+            target_market="market",
+            business_model="model",
+            competition="competition",
+            implementation_plan="plan",
+            creator_id=user_ids[i % len(user_ids)],
+        )
+        for i in range(plans)
+    ])
+    db.flush()
+    plan_ids = [p.id for p in db.query(BusinessPlan).all()]
+    db.add_all([
+        Vote(user_id=user_ids[v % len(user_ids)], business_plan_id=plan_id)
+        for plan_id in plan_ids
+        for v in range(min(votes_per_plan, len(user_ids)))
+    ])
+    db.commit()
+    reconcile_vote_counts(db)
+    return db.query(User).first()
+
+
+@contextmanager
+def count_statements(engine):
+    """Count the SQL statements executed on ``engine`` inside the block"""
+    counter = {"statements": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def timed(fn, repeat: int = 20):
+    """Return the mean wall time of ``fn`` in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
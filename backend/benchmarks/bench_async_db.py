@@ -0,0 +1,108 @@
+"""
+同期セッション（スレッドプール）と非同期セッション（イベントループ）の比較
+
+同じ一覧クエリを def エンドポイント + Session と async def エンドポイント +
+AsyncSession で提供し、同時接続数ごとのレイテンシとスループットを測る。
+PostgreSQL で測る場合は BENCH_DATABASE_URL を指定する（asyncpg が必要）。
+
+    python benchmarks/bench_async_db.py
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_async_db.py
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from _support import make_session_factory, seed
+
+from app.database import Base, _async_database_url
+from app.models.models import BusinessPlan
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "400"))
+
+
+def build_app(SessionLocal, AsyncSessionLocal) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync")
+    def sync_list():
+        db = SessionLocal()
+        try:
+            plans = (
+                db.query(BusinessPlan)
+                .order_by(BusinessPlan.created_at, BusinessPlan.id)
+                .limit(100)
+                .all()
+            )
+            return len(plans)
+        finally:
+            db.close()
+
+    @app.get("/async")
+    async def async_list():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(BusinessPlan)
+                .order_by(BusinessPlan.created_at, BusinessPlan.id)
+                .limit(100)
+            )
+            return len(result.scalars().all())
+
+    return app
+
+
+async def drive(client, path, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (
+        statistics.median(latencies),
+        latencies[int(len(latencies) * 0.95) - 1],
+        REQUESTS / elapsed,
+    )
+
+
+async def main():
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine, SessionLocal = make_session_factory(url)
+    db = SessionLocal()
+    seed(db, users=50, plans=300, votes_per_plan=5)
+    db.close()
+
+    async_engine = create_async_engine(_async_database_url(url))
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    app = build_app(SessionLocal, AsyncSessionLocal)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'path':>6} {'conc':>5} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}")
+        for concurrency in (1, 10, 50, 200):
+            for path in ("/sync", "/async"):
+                p50, p95, rps = await drive(client, path, concurrency)
+                print(f"{path:>6} {concurrency:>5} {p50:>8.2f} {p95:>8.2f} {rps:>8.0f}")
+
+    await async_engine.dispose()
+    if os.getenv("BENCH_DATABASE_URL"):
+        Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
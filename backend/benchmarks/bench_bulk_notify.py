@@ -0,0 +1,81 @@
+"""
+一斉通知の作成ベンチマーク
+
+宛先ユーザーごとに Notification を ORM で追加する従来方式と、
+POST /notifications/bulk が使う INSERT ... SELECT の 1 文を、宛先数を変えて比較する。
+
+    python benchmarks/bench_bulk_notify.py
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_bulk_notify.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from _support import make_session_factory
+
+from app.database import _async_database_url
+from app.models.models import Notification, User
+from app.bulk_notifications import insert_bulk_notifications, recipient_ids
+from app.schemas.schemas import BulkNotificationCreate
+
+SIZES = [int(n) for n in os.getenv("BENCH_RECIPIENTS", "1000,10000,30000").split(",")]
+
+
+def legacy_notify(db, request):
+    """Previous approach: one ORM object per recipient"""
+    user_ids = db.scalars(recipient_ids(request.audience)).all()
+    db.add_all([
+        Notification(
+            user_id=user_id,
+            title=request.title,
+            message=request.message,
+            notification_type=request.notification_type,
+            related_id=request.related_id,
+        )
+        for user_id in user_ids
+    ])
+    db.commit()
+    return len(user_ids)
+
+
+async def main():
+    request = BulkNotificationCreate(title="Deadline", message="Submit by Friday", audience="all")
+    print(f"{'recipients':>10} {'ORM loop ms':>12} {'INSERT..SELECT ms':>18}")
+    for size in SIZES:
+        url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        engine, SessionLocal = make_session_factory(url)
+        db = SessionLocal()
+        db.execute(insert(User), [
+            {"email": f"user{i}@example.com", "username": f"user{i}", "hashed_password": "x",
+             "full_name": f"User {i}", "department": "dev", "role": "user", "is_active": True}
+            for i in range(size)
+        ])
+        db.commit()
+
+        start = time.perf_counter()
+        legacy_count = legacy_notify(db, request)
+        legacy_ms = (time.perf_counter() - start) * 1000
+        db.query(Notification).delete()
+        db.commit()
+
+        async_engine = create_async_engine(_async_database_url(url))
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+        async with AsyncSessionLocal() as adb:
+            start = time.perf_counter()
+            bulk_count = len(await insert_bulk_notifications(adb, request))
+            await adb.commit()
+            bulk_ms = (time.perf_counter() - start) * 1000
+        assert legacy_count == bulk_count == size
+
+        print(f"{size:>10} {legacy_ms:>12.1f} {bulk_ms:>18.1f}")
+        db.close()
+        await async_engine.dispose()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
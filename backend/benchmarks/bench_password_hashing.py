@@ -0,0 +1,80 @@
+"""
+パスワード検証スループットのベンチマーク
+
+ログインが集中した状況を想定し、N 件の bcrypt 検証を同時に投入して
+イベントループ上で直接実行した場合と、ワーカー数を変えたプロセスプールで
+実行した場合の所要時間を比較する。
+
+    python benchmarks/bench_password_hashing.py
+    BENCH_LOGINS=200 python benchmarks/bench_password_hashing.py
+"""
+import asyncio
+import os
+import time
+
+import _support  # noqa: F401  (backend/ を import パスに追加)
+
+from app.password_hashing import PasswordHasher, pwd_context
+
+LOGINS = int(os.getenv("BENCH_LOGINS", "64"))
+
+
+async def probe_latency(stop: asyncio.Event) -> float:
+    """Largest observed event-loop stall while the logins run"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst
+
+
+async def run_inline(hashed: str):
+    async def login():
+        # 従来の同期 verify を async エンドポイントから呼んだ場合と同じ
+        return pwd_context.verify("password123", hashed)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_latency(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await probe
+
+
+async def run_pool(hashed: str, workers: int):
+    hasher = PasswordHasher(workers=workers)
+    # プロセス起動コストを計測から除く
+    await asyncio.gather(*(hasher.verify("password123", hashed) for _ in range(workers)))
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_latency(stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(hasher.verify("password123", hashed) for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    stall = await probe
+    hasher.shutdown()
+    assert all(results)
+    return elapsed, stall
+
+
+async def main():
+    hashed = pwd_context.hash("password123")
+    print(f"{LOGINS} concurrent logins")
+
+    elapsed, stall = await run_inline(hashed)
+    print(f"  inline       : {elapsed:.2f}s  {LOGINS / elapsed:7.1f} logins/s  max loop stall {stall * 1000:7.1f}ms")
+
+    cpus = os.cpu_count() or 1
+    workers = 1
+    while True:
+        elapsed, stall = await run_pool(hashed, workers)
+        print(f"  pool x{workers:<5} : {elapsed:.2f}s  {LOGINS / elapsed:7.1f} logins/s  max loop stall {stall * 1000:7.1f}ms")
+        if workers >= cpus:
+            break
+        workers = min(workers * 2, cpus)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+一覧レスポンスキャッシュのベンチマーク
+
+read_business_plans をキャッシュ無効（毎回 SELECT とシリアライズ）と
+キャッシュ有効（2 回目以降はシリアライズ済みの本文を返す）で呼び比べる。
+投票による無効化を挟んだ場合のヒット率も表示する。
+
+    python benchmarks/bench_response_cache.py
+"""
+import asyncio
+import tempfile
+import time
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from _support import make_session_factory, seed, count_statements
+
+from app.response_cache import response_cache, business_plan_tag, BUSINESS_PLANS_BY_VOTES
+from app.routers.business_plans import read_business_plans
+
+REQUESTS = 500
+
+
+def make_request(limit: int, sort: str = None) -> Request:
+    query = f"limit={limit}" + (f"&sort={sort}" if sort else "")
+    return Request({"type": "http", "method": "GET", "path": "/business_plans/",
+                    "query_string": query.encode(), "headers": []})
+
+
+async def main():
+    url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine, SessionLocal = make_session_factory(url)
+    db = SessionLocal()
+    user = seed(db, plans=500)
+    db.close()
+
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def list_plans(limit, sort=None):
+        async with AsyncSessionLocal() as adb:
+            return await read_business_plans(
+                request=make_request(limit, sort), response=Response(), skip=0, limit=limit,
+                search=None, sort=sort, cursor=None, include_voted_by_me=False, db=adb, current_user=user,
+            )
+
+    async def run(limit, sort=None, invalidate_every=0):
+        response_cache.invalidate(BUSINESS_PLANS_BY_VOTES, business_plan_tag(1))
+        hits = response_cache.hits
+        with count_statements(async_engine.sync_engine) as counter:
+            start = time.perf_counter()
+            for i in range(REQUESTS):
+                if invalidate_every and i % invalidate_every == 0:
+                    # 投票 1 件分の無効化
+                    response_cache.invalidate(business_plan_tag(1), BUSINESS_PLANS_BY_VOTES)
+                await list_plans(limit, sort)
+            elapsed = (time.perf_counter() - start) * 1000 / REQUESTS
+        return elapsed, counter["statements"], response_cache.hits - hits
+
+    print(f"{'case':<34} {'ms/req':>8} {'stmts':>7} {'hits':>6}")
+    for limit in (20, 100):
+        ttl = response_cache.ttl_seconds
+        response_cache.ttl_seconds = 0
+        ms, stmts, hits = await run(limit)
+        print(f"{f'limit={limit} uncached':<34} {ms:>8.2f} {stmts:>7} {hits:>6}")
+        response_cache.ttl_seconds = ttl
+        ms, stmts, hits = await run(limit)
+        print(f"{f'limit={limit} cached':<34} {ms:>8.2f} {stmts:>7} {hits:>6}")
+        ms, stmts, hits = await run(limit, sort="votes", invalidate_every=10)
+        print(f"{f'limit={limit} sort=votes, 1 vote/10 reqs':<34} {ms:>8.2f} {stmts:>7} {hits:>6}")
+    print(response_cache.stats())
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+vote_update 配信フレーム数のベンチマーク
+
+購読中のクライアントを模したダミー接続に対して投票バーストを流し、
+1 更新ごとに送る場合（ウィンドウ 0）と VOTE_UPDATE_WINDOW_MS でまとめた場合の
+送信フレーム数と、最後に各クライアントが受け取った値の正しさを比較する。
+
+    python benchmarks/bench_vote_broadcast.py
+    BENCH_WINDOW_MS=250 python benchmarks/bench_vote_broadcast.py
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import time
+
+import _support  # noqa: F401  (backend/ を import パスに追加)
+
+from app.pubsub import MemoryBus
+from app.websocket_manager import ConnectionManager, plan_topic, PLANS_LIST_TOPIC
+from app.vote_broadcast import VoteUpdatePublisher
+
+CLIENTS = int(os.getenv("BENCH_CLIENTS", "200"))
+PLANS = int(os.getenv("BENCH_PLANS", "20"))
+VOTES = int(os.getenv("BENCH_VOTES", "2000"))
+BURST_SECONDS = float(os.getenv("BENCH_BURST_SECONDS", "2"))
+WINDOW_MS = float(os.getenv("BENCH_WINDOW_MS", "150"))
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = 0
+        self.counts = {}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        self.frames += 1
+        frame = json.loads(message)
+        if frame["type"] == "vote_updates":
+            for update in frame["updates"]:
+                self.counts[update["business_plan_id"]] = update["vote_count"]
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run(window_ms: float):
+    connections = ConnectionManager(queue_size=10000, bus=MemoryBus())
+    # DB なしで測るので件数は読み直さない
+    publisher = VoteUpdatePublisher(connections, window_ms=window_ms, load_counts=None)
+    rng = random.Random(0)
+    sockets = []
+    for i in range(CLIENTS):
+        ws = FakeWebSocket()
+        with contextlib.redirect_stdout(io.StringIO()):
+            connection = await connections.connect(ws, i)
+        # 3 割は一覧画面、残りは個別プランの詳細画面を見ている想定
+        topic = PLANS_LIST_TOPIC if i % 10 < 3 else plan_topic(rng.randint(1, PLANS))
+        connections.subscribe(connection, [topic])
+        sockets.append((ws, topic))
+
+    counts = {plan_id: 0 for plan_id in range(1, PLANS + 1)}
+    start = time.perf_counter()
+    for _ in range(VOTES):
+        plan_id = rng.randint(1, PLANS)
+        counts[plan_id] += 1
+        publisher.publish(plan_id, counts[plan_id])
+        await asyncio.sleep(BURST_SECONDS / VOTES)
+    await asyncio.sleep(window_ms / 1000 + 0.2)
+    elapsed = time.perf_counter() - start
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, (ws, _) in enumerate(sockets):
+            await connections.disconnect(ws, i)
+    await asyncio.sleep(0)
+
+    stale = 0
+    for ws, topic in sockets:
+        watched = counts if topic == PLANS_LIST_TOPIC else {int(topic.split(":")[1]): None}
+        stale += sum(1 for plan_id in watched if ws.counts.get(plan_id) != counts[plan_id])
+    return publisher.stats(), sum(ws.frames for ws, _ in sockets), stale, elapsed
+
+
+async def main():
+    print(f"{VOTES} votes over {BURST_SECONDS}s on {PLANS} plans, {CLIENTS} subscribed clients")
+    for window_ms in (0, WINDOW_MS):
+        stats, delivered, stale, elapsed = await run(window_ms)
+        print(
+            f"  window {window_ms:5.0f}ms: {stats['frames_sent']:7d} frames "
+            f"(uncoalesced {stats['frames_uncoalesced']}, saved {stats['frames_saved']}), "
+            f"delivered {delivered}, stale clients {stale}, {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+一覧取得時の投票数集計ベンチマーク
+
+プランごとに COUNT を発行する従来方式と、非正規化カウンタ
+（BusinessPlan.vote_count）を読む read_business_plans を比較し、
+ページサイズを変えても SQL 発行数が一定であることを確認する。
+
+    python benchmarks/bench_vote_counts.py
+"""
+import asyncio
+import json
+import tempfile
+import time
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from _support import make_session_factory, seed, count_statements, timed
+
+from app.models.models import BusinessPlan, Vote
+from app.response_cache import response_cache
+from app.routers.business_plans import read_business_plans
+
+
+def legacy_read_business_plans(db, limit):
+    """Previous implementation: one COUNT query per plan"""
+    plans = db.query(BusinessPlan).offset(0).limit(limit).all()
+    for plan in plans:
+        plan.vote_count = (
+            db.query(Vote)
+            .filter(Vote.business_plan_id == plan.id)
+            .count()
+        )
+    return plans
+
+
+async def main():
+    url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine, SessionLocal = make_session_factory(url)
+    db = SessionLocal()
+    user = seed(db)
+
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    # 毎回 SELECT させるため、レスポンスキャッシュは使わない
+    response_cache.ttl_seconds = 0
+
+    async def counter_path(limit):
+        async with AsyncSessionLocal() as adb:
+            response = await read_business_plans(
+                request=Request({"type": "http", "headers": []}), response=Response(),
+                skip=0, limit=limit, search=None, sort=None, cursor=None,
+                include_voted_by_me=False, db=adb, current_user=user,
+            )
+        return json.loads(response.body)
+
+    async def timed_async(fn, repeat=20):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await fn()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    print(f"{'limit':>6} {'legacy stmts':>13} {'legacy ms':>10} {'counter stmts':>14} {'counter ms':>11}")
+    for limit in (10, 50, 100, 200):
+        def legacy():
+            db.expire_all()
+            return legacy_read_business_plans(db, limit)
+
+        with count_statements(engine) as legacy_count:
+            legacy_plans = legacy()
+        with count_statements(async_engine.sync_engine) as counter_count:
+            counter_plans = await counter_path(limit)
+        assert [p.vote_count for p in legacy_plans] == [p["vote_count"] for p in counter_plans]
+
+        counter_ms = await timed_async(lambda: counter_path(limit))
+        print(
+            f"{limit:>6} {legacy_count['statements']:>13} {timed(legacy):>10.2f}"
+            f" {counter_count['statements']:>14} {counter_ms:>11.2f}"
+        )
+    db.close()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
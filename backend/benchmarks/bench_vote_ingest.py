@@ -0,0 +1,77 @@
+"""
+投票取り込みスループットのベンチマーク
+
+リクエストごとにコミットする従来方式と、VOTE_INGEST_MODE=batched の
+グループコミット方式で、同時投票を処理するスループットを比較する。
+
+    python benchmarks/bench_vote_ingest.py
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_vote_ingest.py
+"""
+import importlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import BackgroundTasks, HTTPException
+
+from _support import make_session_factory, seed
+
+from app import vote_ingest
+from app.models.models import User, BusinessPlan
+# app.routers は router オブジェクトを再エクスポートしているためモジュールを直接取得
+business_plans_router = importlib.import_module("app.routers.business_plans")
+
+VOTERS = int(os.getenv("BENCH_VOTERS", "1000"))
+THREADS = int(os.getenv("BENCH_THREADS", "40"))  # Starlette のスレッドプール相当
+
+
+def run(SessionLocal, user_ids, plan_ids):
+    def cast(i):
+        db = SessionLocal()
+        try:
+            user = db.get(User, user_ids[i])
+            business_plans_router.vote_for_business_plan(
+                business_plan_id=plan_ids[i % len(plan_ids)],
+                background_tasks=BackgroundTasks(),
+                db=db,
+                current_user=user,
+            )
+            return True
+        except HTTPException:
+            return False
+        finally:
+            db.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        accepted = sum(pool.map(cast, range(len(user_ids))))
+    return accepted, time.perf_counter() - start
+
+
+def main():
+    for mode in ("direct", "batched"):
+        url = os.getenv("BENCH_DATABASE_URL")
+        if url is None:
+            url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        engine, SessionLocal = make_session_factory(url)
+        db = SessionLocal()
+        seed(db, users=VOTERS, plans=20, votes_per_plan=0)
+        user_ids = [u.id for u in db.query(User).all()]
+        plan_ids = [p.id for p in db.query(BusinessPlan).all()]
+        db.close()
+
+        vote_ingest.VOTE_INGEST_MODE = mode
+        business_plans_router.vote_ingestor = vote_ingest.VoteIngestor(session_factory=SessionLocal)
+        accepted, elapsed = run(SessionLocal, user_ids, plan_ids)
+        business_plans_router.vote_ingestor.stop()
+
+        print(f"{mode:>8}: {accepted} votes in {elapsed:.2f}s -> {accepted / elapsed:,.0f} votes/s")
+        if os.getenv("BENCH_DATABASE_URL"):
+            from app.database import Base
+            Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
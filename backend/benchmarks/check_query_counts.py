@@ -0,0 +1,94 @@
+"""
+詳細レスポンスの SQL 発行数チェック
+
+read_business_plan / read_poc_plan / read_user を呼び、レスポンスモデルへのシリアライズまで含めて
+発行された SQL を数える。投票数・PoC 数・チーム人数を変えても EXPECTED の件数から
+変わらない（関連の遅延ロードで N+1 になっていない、履歴を丸ごと読み込んでいない）ことを確認する。
+
+    python benchmarks/check_query_counts.py
+"""
+import sys
+import tempfile
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from _support import make_session_factory, seed, count_statements
+
+from app.models.models import BusinessPlan, PoCPlan, TeamMember, User, Vote
+from app.routers.business_plans import read_business_plan
+from app.routers.poc_plans import read_poc_plan
+from app.routers.users import read_user
+from app.schemas.schemas import BusinessPlanDetailResponse, PoCPlanDetailResponse, UserSummaryResponse
+from app.vote_counter import reconcile_vote_counts
+
+# 関連の件数 -> ルートごとの SQL 発行数（バージョン取得 + 本体 + selectinload ごとに 1）
+SIZES = (0, 5, 50)
+EXPECTED = {
+    "business plan detail": 3,
+    "PoC plan detail": 3,
+    "user profile": 1,
+}
+
+
+def populate(db):
+    """
+    One business plan, PoC plan and user per size, each with ``size`` votes,
+    PoC plans and team members (the user casts the votes and joins the teams)
+    """
+    seed(db, users=max(SIZES) + 1, plans=len(SIZES), votes_per_plan=0)
+    user_ids = [u.id for u in db.query(User).order_by(User.id)]
+    plans = db.query(BusinessPlan).order_by(BusinessPlan.id).all()
+    targets = {}
+    for size, plan in zip(SIZES, plans):
+        db.add_all(Vote(user_id=user_id, business_plan_id=plan.id) for user_id in user_ids[1:size + 1])
+        poc_plans = [
+            PoCPlan(title=f"PoC {i}", description="d", technical_requirements="t", implementation_details="i",
+                    timeline="t", resources_needed="r", expected_outcomes="e",
+                    creator_id=user_ids[i % len(user_ids)], business_plan_id=plan.id)
+            for i in range(max(size, 1))
+        ]
+        db.add_all(poc_plans)
+        db.flush()
+        db.add_all(
+            TeamMember(user_id=user_id, poc_plan_id=poc_plans[0].id, role="technical")
+            for user_id in user_ids[1:size + 1]
+        )
+        targets[size] = (plan.id, poc_plans[0].id, user_ids[size])
+    db.commit()
+    reconcile_vote_counts(db)
+    return targets
+
+
+def main():
+    engine, SessionLocal = make_session_factory(f"sqlite:///{tempfile.mkdtemp()}/counts.db")
+    with SessionLocal() as db:
+        targets = populate(db)
+
+    def conditional(route, param):
+        return lambda db, target: route(**{param: target}, request=Request({"type": "http", "headers": []}),
+                                    response=Response(), db=db, current_user=None)
+
+    routes = {
+        "business plan detail": (conditional(read_business_plan, "business_plan_id"), 0,
+                                 TypeAdapter(BusinessPlanDetailResponse)),
+        "PoC plan detail": (conditional(read_poc_plan, "poc_plan_id"), 1, TypeAdapter(PoCPlanDetailResponse)),
+        "user profile": (lambda db, target: read_user(user_id=target, db=db, current_user=None), 2,
+                         TypeAdapter(UserSummaryResponse)),
+    }
+    failures = 0
+    print(f"{'':>4}  {'route':<22} {'size':>5} {'statements':>11} {'expected':>9}")
+    for name, (route, index, adapter) in routes.items():
+        for size in SIZES:
+            with SessionLocal() as db, count_statements(engine) as counter:
+                result = route(db, targets[size][index])
+                adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+            ok = counter["statements"] == EXPECTED[name]
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':>4}  {name:<22} {size:>5} {counter['statements']:>11} {EXPECTED[name]:>9}")
+    print(f"{len(routes) * len(SIZES) - failures}/{len(routes) * len(SIZES)} detail responses use a fixed number of queries")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import models and database settings
 from app.database import engine
-from app.models import models
+from app.migrations import migrate
 
 def create_database():
     """Create PostgreSQL database"""
@@ -53,12 +53,13 @@ def create_database():
         return False
 
 def create_tables():
-    """Create database tables"""
+    """Create or upgrade database tables by applying pending migrations"""
     try:
-        print("Trying to create database tables...")
-        # Create tables
-        models.Base.metadata.create_all(bind=engine)
-        print("Database tables created")
+        print("Trying to apply database migrations...")
+        applied = migrate(engine)
+        for version in applied:
+            print(f"Applied migration {version}")
+        print("Database schema is up to date")
         return True
     except OperationalError as e:
         print(f"Table creation error: {str(e)}")
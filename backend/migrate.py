@@ -0,0 +1,29 @@
+import os
+import sys
+
+# Add application path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from app.migrations import MigrationContext, migrate, migration_status
+from app.migrations.v0007_notification_partitioning import partition_notifications
+
+def main():
+    """Apply pending schema migrations (--status only lists them)"""
+    if "--partition-notifications" in sys.argv[1:]:
+        # NOTIFICATION_PARTITIONING を後から有効にしたとき用（v0007 は適用済みでも変換する）
+        migrate(engine)
+        partition_notifications(MigrationContext(engine))
+        print("notifications is partitioned by month")
+        return
+    if "--status" in sys.argv[1:]:
+        for version, description, applied in migration_status(engine):
+            print(f"{'applied' if applied else 'pending':>8}  {version}  {description}")
+        return
+    applied = migrate(engine)
+    for version in applied:
+        print(f"Applied migration {version}")
+    print("Database schema is up to date" if applied else "No pending migrations")
+
+if __name__ == "__main__":
+    main()
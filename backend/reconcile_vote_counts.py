@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Add application path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.vote_counter import reconcile_vote_counts
+from app.unread_counter import reconcile_unread_counts
+
+def main():
+    """Recompute the denormalized counters (vote counts and unread notification counts)"""
+    db = SessionLocal()
+    try:
+        fixed = reconcile_vote_counts(db)
+        print(f"Reconciled vote counts: {fixed} business plan(s) corrected")
+        fixed = reconcile_unread_counts(db)
+        print(f"Reconciled unread notification counts: {fixed} user(s) corrected")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,15 @@ BEGIN
 END
 $$;
 
+-- 全文検索の部分一致用（トライグラム）
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- ENUM 型の定義
 CREATE TYPE userrole AS ENUM ('user', 'admin');
 
 -- テーブル削除（依存関係を考慮して順番）
+DROP TABLE IF EXISTS notifications_archive CASCADE;
+DROP TABLE IF EXISTS pubsub_payloads;
 DROP TABLE IF EXISTS notifications CASCADE;
 DROP TABLE IF EXISTS team_members CASCADE;
 DROP TABLE IF EXISTS poc_plans CASCADE;
@@ -31,7 +36,9 @@ CREATE TABLE users (
     role userrole DEFAULT 'user',
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMPTZ DEFAULT now(),
-    updated_at TIMESTAMPTZ
+    updated_at TIMESTAMPTZ,
+    unread_notification_count INTEGER NOT NULL DEFAULT 0,
+    notifications_version INTEGER NOT NULL DEFAULT 0 -- 通知一覧の ETag 用の版
 );
 
 -- business_plans
@@ -48,6 +55,7 @@ CREATE TABLE business_plans (
     creator_name TEXT,
     creator_id INTEGER REFERENCES users(id),
     is_selected BOOLEAN DEFAULT FALSE,
+    vote_count INTEGER NOT NULL DEFAULT 0, -- votes の件数（reconcile_vote_counts.py で再計算可能）
     created_at TIMESTAMPTZ DEFAULT now(),
     updated_at TIMESTAMPTZ
 );
@@ -57,7 +65,9 @@ CREATE TABLE votes (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id),
     business_plan_id INTEGER REFERENCES business_plans(id),
-    created_at TIMESTAMPTZ DEFAULT now()
+    created_at TIMESTAMPTZ DEFAULT now(),
+    -- 1ユーザー1プラン1票（ON CONFLICT DO NOTHING の衝突対象）
+    CONSTRAINT uq_votes_user_plan UNIQUE (user_id, business_plan_id)
 );
 
 -- poc_plans
@@ -84,7 +94,8 @@ CREATE TABLE team_members (
     user_id INTEGER REFERENCES users(id),
     poc_plan_id INTEGER REFERENCES poc_plans(id),
     role VARCHAR,
-    created_at TIMESTAMPTZ DEFAULT now()
+    created_at TIMESTAMPTZ DEFAULT now(),
+    CONSTRAINT uq_team_members_plan_user UNIQUE (poc_plan_id, user_id)
 );
 
 -- notifications
@@ -96,7 +107,30 @@ CREATE TABLE notifications (
     is_read BOOLEAN DEFAULT FALSE,
     notification_type VARCHAR,
     related_id INTEGER,
-    created_at TIMESTAMPTZ DEFAULT now()
+    created_at TIMESTAMPTZ DEFAULT now(),
+    -- アウトボックス（pending → dispatched）
+    delivery_status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    dispatched_at TIMESTAMPTZ
+);
+
+-- （任意）月単位のレンジパーティション
+-- NOTIFICATION_PARTITIONING=true を設定して python migrate.py --partition-notifications を実行すると、
+-- 上の notifications を created_at の月単位レンジパーティション（主キーは (id, created_at)）に変換する。
+-- 当月と翌月以降のパーティションは NotificationSweeper が起動時と毎回のスイープで作成する。
+
+-- notifications_archive（保持期間を過ぎた既読通知の退避先）
+CREATE TABLE notifications_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    title VARCHAR,
+    message TEXT,
+    is_read BOOLEAN,
+    notification_type VARCHAR,
+    related_id INTEGER,
+    created_at TIMESTAMPTZ,
+    delivery_status VARCHAR(16),
+    dispatched_at TIMESTAMPTZ,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 --password_reset_tokens
@@ -141,4 +175,35 @@ CREATE TABLE email_verification_tokens (
     expires_at  TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at  TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
     updated_at  TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
-);
\ No newline at end of file
+);
+
+-- pubsub_payloads（NOTIFY の上限を超える pub/sub メッセージの本文。数分で削除される）
+CREATE UNLOGGED TABLE pubsub_payloads (
+    id BIGSERIAL PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX ix_pubsub_payloads_created_at ON pubsub_payloads (created_at);
+
+-- 一覧のキーセット（カーソル）ページネーション用複合インデックス
+CREATE INDEX ix_users_created_at_id ON users (created_at, id);
+CREATE INDEX ix_business_plans_created_at_id ON business_plans (created_at, id);
+CREATE INDEX ix_business_plans_vote_count_id ON business_plans (vote_count, id);
+CREATE INDEX ix_poc_plans_created_at_id ON poc_plans (created_at, id);
+CREATE INDEX ix_notifications_user_id_created_at_id ON notifications (user_id, created_at, id);
+CREATE INDEX ix_notifications_pending ON notifications (id) WHERE delivery_status = 'pending';
+CREATE INDEX ix_votes_business_plan_id ON votes (business_plan_id);
+CREATE INDEX ix_poc_plans_business_plan_id ON poc_plans (business_plan_id);
+CREATE INDEX ix_business_plans_creator_id ON business_plans (creator_id);
+CREATE INDEX ix_poc_plans_creator_id ON poc_plans (creator_id);
+CREATE INDEX ix_team_members_user_id ON team_members (user_id);
+CREATE INDEX ix_notifications_user_id_is_read_created_at ON notifications (user_id, is_read, created_at);
+CREATE INDEX ix_notifications_archive_user_id_created_at ON notifications_archive (user_id, created_at);
+
+-- 全文検索（tsvector 生成列 + GIN、日本語の部分一致用に pg_trgm）
+ALTER TABLE business_plans ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(title, '')), 'A') || setweight(to_tsvector('simple', coalesce(description, '')), 'B') || setweight(to_tsvector('simple', coalesce(problem_statement, '')), 'C') || setweight(to_tsvector('simple', coalesce(solution, '')), 'C')) STORED;
+CREATE INDEX IF NOT EXISTS ix_business_plans_search_vector ON business_plans USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS ix_business_plans_search_trgm ON business_plans USING GIN ((coalesce(business_plans.title, '') || ' ' || coalesce(business_plans.description, '') || ' ' || coalesce(business_plans.problem_statement, '') || ' ' || coalesce(business_plans.solution, '')) gin_trgm_ops);
+ALTER TABLE poc_plans ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(title, '')), 'A') || setweight(to_tsvector('simple', coalesce(description, '')), 'B') || setweight(to_tsvector('simple', coalesce(technical_requirements, '')), 'C') || setweight(to_tsvector('simple', coalesce(implementation_details, '')), 'C')) STORED;
+CREATE INDEX IF NOT EXISTS ix_poc_plans_search_vector ON poc_plans USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS ix_poc_plans_search_trgm ON poc_plans USING GIN ((coalesce(poc_plans.title, '') || ' ' || coalesce(poc_plans.description, '') || ' ' || coalesce(poc_plans.technical_requirements, '') || ' ' || coalesce(poc_plans.implementation_details, '')) gin_trgm_ops);
\ No newline at end of file